@@ -1,12 +1,13 @@
+import os
+import threading
 import tkinter as tk
 from tkinter import filedialog, messagebox
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, ImageTk
 #import numpy as np
 #import cv2
 #from skimage.color import rgb2gray
 #from skimage import io
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from logic import CurrencyDetector
 
 # Modern Color Scheme
@@ -19,9 +20,16 @@ BUTTON_BG = '#E84545'  # Red buttons
 HOVER_COLOR = '#FF6B6B'  # Lighter red for hover  
 FRAME_BG = '#2B3A67'  # Navy blue for frames     
 
+# Animation and polling intervals (ms)
+FRAME_MS = 16
+POLL_MS = 50
+HOVER_STEPS = 5
+
 # Paths to images
 LOGO_PATH = r"gui\detective.png"
 MODEL_PATH = r"model.joblib"
+# Optional SQLite feature cache, so re-uploaded notes skip feature extraction
+CACHE_PATH = os.environ.get("FAKE_MONEY_CACHE")
 
 class ModernFrame(tk.Frame):
     """Custom frame without visible borders for clean modern styling"""
@@ -76,21 +84,29 @@ class ModernButton(tk.Button):
         self.bind("<Enter>", self.on_enter)                        
         self.bind("<Leave>", self.on_leave)                         
         
+        self._fade_job = None
+        
     def on_enter(self, e):
         """Mouse enter effect"""
-        self.configure(background=self.hover_bg)
-        # Smooth transition effect
-        for i in range(5):
-            self.update_idletasks()
-            self.after(20)
+        self.fade_to(self.hover_bg)
         
     def on_leave(self, e):                            
         """Mouse leave effect"""                              
-        self.configure(background=self.default_bg)                      
-        # Smooth transition effect                        
-        for i in range(5):                    
-            self.update_idletasks()                        
-            self.after(20)                      
+        self.fade_to(self.default_bg)
+        
+    def fade_to(self, color, step=1):
+        """Blend the background towards color one frame at a time without blocking"""
+        if step == 1 and self._fade_job is not None:
+            self.after_cancel(self._fade_job)
+        current = self.winfo_rgb(self.cget("background"))
+        target = self.winfo_rgb(color)
+        remaining = HOVER_STEPS - step + 1
+        blended = [c + (t - c) // remaining for c, t in zip(current, target)]
+        self.configure(background="#%02x%02x%02x" % tuple(v >> 8 for v in blended))
+        if step < HOVER_STEPS:
+            self._fade_job = self.after(FRAME_MS, self.fade_to, color, step + 1)
+        else:
+            self._fade_job = None
 
 class ActionText(tk.Label):          
     """Clickable text with hover effect"""            
@@ -126,11 +142,24 @@ class FakeMoneyDetective:
         self.root.configure(bg=MAIN_BG)        
         
         # Initialize the detector                                
-        self.detector = CurrencyDetector(MODEL_PATH)                  
+        cache = None
+        if CACHE_PATH:
+            from feature_cache import FeatureCache
+            cache = FeatureCache(CACHE_PATH)
+        self.detector = CurrencyDetector(MODEL_PATH, cache=cache)                  
         if self.detector.model is None:                       
             messagebox.showerror("Error", "Could not load model")                        
             
         self.current_image_path = None                          
+        self.current_result = None
+        self.analysis_error = None
+        
+        # Image analysis runs off the Tk main loop; job_id identifies the newest upload
+        # and job_cancel lets a newer upload stop the one still running
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.job = None
+        self.job_id = 0
+        self.job_cancel = None
         self.setup_ui()                                      
         
     def setup_ui(self):               
@@ -336,7 +365,7 @@ class FakeMoneyDetective:
         ).pack(pady=10)
 
     def show_analysis(self):
-        if not self.current_image_path:
+        if not self.current_image_path or self.job is not None:
             return
             
         if hasattr(self, 'analysis_window') and self.analysis_window.winfo_exists():
@@ -353,7 +382,14 @@ class FakeMoneyDetective:
         analysis_frame.pack(fill=tk.BOTH, expand=True, padx=30, pady=30)
         
         try:
-            _, _, features = self.detector.predict_banknote(self.current_image_path)
+            # matplotlib and its Tk backend are only needed here
+            import matplotlib.pyplot as plt
+            from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+            
+            # Never re-run the analysis on the Tk thread; show why it failed instead
+            if self.current_result is None:
+                raise RuntimeError(self.analysis_error or "no analysis result for this image")
+            features = self.current_result.features
             
             tk.Label(
                 analysis_frame,
@@ -368,17 +404,21 @@ class FakeMoneyDetective:
             fig.patch.set_facecolor(MAIN_BG)
             
             ax = fig.add_subplot(111)
-            feature_names = ['Variance', 'Skewness', 'Kurtosis', 'Entropy']
+            feature_names = [name.capitalize() for name in self.detector.extractor.feature_names]
             bars = ax.bar(feature_names, features, color=SECONDARY_COLOR)
+            # Multi-window extractors (tiles) give one bar per window and feature
+            many = len(feature_names) > 4
             
             # Style the plot
             ax.set_facecolor(MAIN_BG)
             ax.tick_params(colors=TEXT_COLOR, labelsize=12)
             for spine in ax.spines.values():
                 spine.set_color(TEXT_COLOR)
+            if many:
+                ax.tick_params(axis='x', labelrotation=90, labelsize=7)
             
             # Add value labels
-            for bar, val in zip(bars, features):
+            for bar, val in zip(bars, [] if many else features):
                 height = bar.get_height()
                 ax.text(
                     bar.get_x() + bar.get_width()/2.,
@@ -424,32 +464,67 @@ class FakeMoneyDetective:
         ).pack(pady=20)
 
     def upload_currency(self):
-        """Handle currency image upload and processing"""
+        """Handle currency image upload and start processing in the background"""
         filetypes = [("Image files", "*.png *.jpg *.jpeg *.bmp *.gif")]
         path = filedialog.askopenfilename(title="Select Currency Image", filetypes=filetypes)
         if not path:
             return
             
         self.current_image_path = path
+        self.current_result = None
+        self.analysis_error = None
+        
+        # A newer upload supersedes any analysis still queued or running
+        if self.job is not None:
+            self.job_cancel.set()
+            self.job.cancel()
+        self.job_id += 1
+        self.job_cancel = threading.Event()
+        self.job = self.executor.submit(self.run_analysis, path, self.job_cancel)
+        self.result_label.config(text="Analyzing", fg=TEXT_COLOR)
+        self.confidence_label.config(text="")
+        self.root.after(POLL_MS, self.poll_analysis, self.job_id, self.job, 0)
+        
+    def run_analysis(self, path, cancel):
+        """Worker thread: thumbnail, decode, Sobel and predict (no Tk calls here)"""
+        img = Image.open(path)
+        img.thumbnail((280, 180), Image.Resampling.LANCZOS)
+        
+        # Decode, run Sobel and predict in a single pass, stopping early
+        # once a newer upload sets cancel
+        analysis = self.detector.analyze(path, cancel)
+        
+        processed_img = Image.fromarray(analysis.gradient)
+        processed_img.thumbnail((280, 180), Image.Resampling.LANCZOS)
+        return img, processed_img, analysis
+        
+    def poll_analysis(self, job_id, job, tick):
+        """Main thread: wait for the worker without blocking, then show its results"""
+        if job_id != self.job_id:
+            return  # a newer upload replaced this one
+        if not job.done():
+            self.result_label.config(text="Analyzing" + "." * (tick % 4))
+            self.root.after(POLL_MS, self.poll_analysis, job_id, job, tick + 1)
+            return
+        self.job = None
+        self.job_cancel = None
         
         try:
+            img, processed_img, analysis = job.result()
+            self.current_result = analysis
+            
             # Display original image
-            img = Image.open(path)
-            img.thumbnail((280, 180), Image.Resampling.LANCZOS)
             photo = ImageTk.PhotoImage(img)
             self.image_label.config(image=photo)
             self.image_label.image = photo
             
-            # Process and display edge detection
-            grad_norm = self.detector.process_image(path)
-            processed_img = Image.fromarray(grad_norm)
-            processed_img.thumbnail((280, 180), Image.Resampling.LANCZOS)
+            # Display edge detection
             processed_photo = ImageTk.PhotoImage(processed_img)
             self.processed_label.config(image=processed_photo)
             self.processed_label.image = processed_photo
             
             if self.detector.model is not None:
-                result, confidence, _ = self.detector.predict_banknote(path)
+                result, confidence = analysis.label, analysis.confidence
                 
                 if result and "REAL" in result:
                     self.result_label.config(text=result, fg='#4CAF50')
@@ -466,7 +541,8 @@ class FakeMoneyDetective:
                 self.result_label.config(text="Model not loaded", fg=TEXT_COLOR)
                 
         except Exception as e:
-            messagebox.showerror("Error", f"Error processing image: {e}")
+            self.analysis_error = f"Error processing image: {e}"
+            messagebox.showerror("Error", self.analysis_error)
             self.result_label.config(text="Analysis Error", fg=TEXT_COLOR)
             self.confidence_label.config(text="")
 
@@ -475,3 +551,6 @@ if __name__ == "__main__":
     root = tk.Tk()
     app = FakeMoneyDetective(root)
     root.mainloop()
+    if app.job_cancel is not None:
+        app.job_cancel.set()
+    app.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,288 @@
+"""
+Benchmarks for the detection pipeline.
+
+    python -m benchmark startup [--flat model.forest]
+    python -m benchmark stages --save bench.json
+    python -m benchmark compare baseline.json bench.json --threshold 0.2
+
+Stage benchmarks run fully offline on synthetic JPEGs (phone shot up to
+24 MP scanner output) plus the sampels/ images.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+MODEL_PATH = "model.joblib"
+SAMPLE_IMAGE = os.path.join("sampels", "real money.jpg")
+
+# Synthetic image sizes (width, height)
+SIZES = {
+    "vga": (640, 480),
+    "phone_2mp": (1920, 1080),
+    "phone_12mp": (4032, 3024),
+    "scanner_24mp": (6000, 4000),
+}
+BATCH_SIZE = 256
+
+# Runs in a fresh interpreter so every import is cold
+_STARTUP_SNIPPET = """
+import json, sys, time
+t0 = time.perf_counter()
+from logic import CurrencyDetector
+t1 = time.perf_counter()
+detector = CurrencyDetector(sys.argv[1])
+t2 = time.perf_counter()
+detector.predict_banknote(sys.argv[2])
+t3 = time.perf_counter()
+print(json.dumps({"import_s": t1 - t0, "load_s": t2 - t1, "first_predict_s": t3 - t2}))
+"""
+
+
+def measure_startup(model_path, image=SAMPLE_IMAGE, repeat=5):
+    """Median cold import, model load and first prediction times"""
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-W", "ignore", "-c", _STARTUP_SNIPPET, model_path, image],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+    result = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+    result["total_s"] = sum(result.values())
+    return result
+
+
+def startup(args):
+    models = {"joblib": args.model}
+    tmp = None
+    if args.flat is None:
+        import joblib
+        from flat_forest import export_forest
+        tmp = tempfile.TemporaryDirectory()
+        args.flat = os.path.join(tmp.name, "model.forest")
+        export_forest(joblib.load(args.model), args.flat)
+    models["flat"] = args.flat
+
+    results = {name: measure_startup(path, args.image, args.repeat) for name, path in models.items()}
+    print(f"{'model':<8}{'import':>10}{'load':>10}{'1st pred':>10}{'total':>10}")
+    for name, r in results.items():
+        print(f"{name:<8}{r['import_s']*1000:>8.0f}ms{r['load_s']*1000:>8.0f}ms"
+              f"{r['first_predict_s']*1000:>8.0f}ms{r['total_s']*1000:>8.0f}ms")
+    if tmp is not None:
+        tmp.cleanup()
+
+
+def synthetic_image(path, size, seed=0):
+    """Write a deterministic note-like JPEG: smooth gradients plus fine texture"""
+    import cv2
+    width, height = size
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = 128 + 60 * np.sin(x / (width / 7.0)) * np.cos(y / (height / 5.0))
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    for c in range(3):
+        noise = rng.normal(0, 12, (height, width)).astype(np.float32)
+        img[..., c] = np.clip(base + 20 * c + noise, 0, 255)
+    cv2.imwrite(path, img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return path
+
+
+def time_call(func, repeat):
+    """Median and minimum wall time of func over repeat calls"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {"median_s": statistics.median(times), "min_s": min(times), "repeat": repeat}
+
+
+def bench_image(detector, path, repeat):
+    """Time every stage of the pipeline on one image"""
+    import cv2
+    from skimage import io
+    from skimage.color import rgb2gray
+    from skimage.measure import shannon_entropy
+    import logic
+    from features import TiledExtractor
+
+    tiles = TiledExtractor()
+    raw = io.imread(path)
+    gray = rgb2gray(raw) if raw.ndim == 3 else raw
+    small = cv2.resize(gray, logic.RESIZE_TARGET)
+    small_u8 = logic.resize_image(logic.to_grayscale_u8(raw))
+    grad = logic.sobel_gradient(gray)
+    features = logic.gradient_features(grad)
+
+    def sobel():
+        sobel_x = cv2.Sobel(small, cv2.CV_64F, 1, 0, ksize=logic.SOBEL_KSIZE)
+        sobel_y = cv2.Sobel(small, cv2.CV_64F, 0, 1, ksize=logic.SOBEL_KSIZE)
+        return np.hypot(sobel_x, sobel_y)
+
+    def moments():
+        var = np.var(grad)
+        skew = np.mean(((grad - grad.mean())/grad.std())**3)
+        kurt = np.mean(((grad - grad.mean())/grad.std())**4) - 3
+        return var, skew, kurt
+
+    stages = {
+        "decode": lambda: io.imread(path),
+        "decode_reduced_grayscale": lambda: logic.decode_reduced_grayscale(path),
+        "rgb2gray": lambda: rgb2gray(raw) if raw.ndim == 3 else raw,
+        "resize": lambda: cv2.resize(gray, logic.RESIZE_TARGET),
+        "sobel": sobel,
+        "moments": moments,
+        "shannon_entropy": lambda: shannon_entropy(grad),
+        "fused_features": lambda: logic.gradient_features(grad),
+        "integer_sobel_features": lambda: logic.integer_gradient_features(
+            logic.sobel_magnitude_int(small_u8)),
+        "tiled_features_native": lambda: tiles.extract(gray),
+        "extract_sobel_features": lambda: detector.extract_sobel_features(path),
+    }
+    if detector.model is not None:
+        stages["predict"] = lambda: detector.model.predict(features)
+        stages["predict_proba"] = lambda: detector.model.predict_proba(features)
+        stages["predict_banknote"] = lambda: detector.predict_banknote(path)
+    return {name: time_call(func, repeat) for name, func in stages.items()}
+
+
+def bench_batch(detector, paths, repeat):
+    """Batch throughput: model-only scoring of many rows and predict_many over images"""
+    results = {}
+    if detector.model is None:
+        return results
+    rows = np.vstack([detector.extract_sobel_features(p) for p in paths])
+    rows = np.resize(rows, (BATCH_SIZE, rows.shape[1]))
+    timing = time_call(lambda: detector.predict_features(rows), repeat)
+    timing["items_per_s"] = BATCH_SIZE / timing["median_s"]
+    results["predict_features_x%d" % BATCH_SIZE] = timing
+    timing = time_call(lambda: detector.predict_many(paths), repeat)
+    timing["items_per_s"] = len(paths) / timing["median_s"]
+    results["predict_many_x%d" % len(paths)] = timing
+    return results
+
+
+def stages(args):
+    from logic import CurrencyDetector
+    detector = CurrencyDetector(args.model)
+    samples = sorted(glob.glob(os.path.join("sampels", "*.jpg")))
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        images = {}
+        for name in args.sizes:
+            images[name] = synthetic_image(os.path.join(tmp, name + ".jpg"), SIZES[name])
+        for path in samples:
+            images["sample/" + os.path.basename(path)] = path
+
+        for name, path in images.items():
+            repeat = args.repeat if "24mp" not in name else max(1, args.repeat // 2)
+            for stage, timing in bench_image(detector, path, repeat).items():
+                results[f"{name}/{stage}"] = timing
+        for stage, timing in bench_batch(detector, samples, args.repeat).items():
+            results["batch/" + stage] = timing
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "model": args.model,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    for key, timing in results.items():
+        print(f"{key:<50}{timing['median_s']*1000:>10.2f}ms")
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            return compare_reports(json.load(f), report, args.threshold)
+    return 0
+
+
+def compare_reports(baseline, current, threshold):
+    """
+    Print per-stage changes and return 1 if any stage's median got
+    slower than baseline by more than threshold (a fraction), or a
+    baseline stage is missing from current, else 0.
+    """
+    regressions = []
+    missing = []
+    for key, base in baseline["results"].items():
+        if key not in current["results"]:
+            missing.append(key)
+            print(f"{key:<50}{base['median_s']*1000:>10.2f}ms -> {'missing':>12}  MISSING")
+            continue
+        median = current["results"][key]["median_s"]
+        if base["median_s"] > 0:
+            ratio = median / base["median_s"]
+        else:
+            ratio = 1.0 if median == 0 else float("inf")
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions.append(key)
+            flag = "  REGRESSION"
+        print(f"{key:<50}{base['median_s']*1000:>10.2f}ms -> "
+              f"{current['results'][key]['median_s']*1000:>10.2f}ms ({ratio:5.2f}x){flag}")
+    if missing:
+        print(f"{len(missing)} baseline stage(s) missing from the current report")
+    if regressions:
+        print(f"{len(regressions)} stage(s) regressed by more than {threshold:.0%}")
+    if missing or regressions:
+        return 1
+    print("No regressions")
+    return 0
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    return compare_reports(baseline, current, args.threshold)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the detection pipeline")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("startup", help="cold import, model load and first prediction")
+    p.add_argument("-m", "--model", default=MODEL_PATH)
+    p.add_argument("--flat", default=None, help="exported flat forest (default: export a temporary one)")
+    p.add_argument("--image", default=SAMPLE_IMAGE)
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(run=startup)
+
+    p = commands.add_parser("stages", help="per-stage latency and batch throughput")
+    p.add_argument("-m", "--model", default=MODEL_PATH)
+    p.add_argument("--sizes", nargs="+", choices=sorted(SIZES), default=list(SIZES))
+    p.add_argument("--repeat", type=int, default=7)
+    p.add_argument("--save", default=None, help="write results to this JSON file")
+    p.add_argument("--compare", default=None, help="baseline JSON to check for regressions")
+    p.add_argument("--threshold", type=float, default=0.2,
+                   help="allowed slowdown per stage as a fraction (default: 0.2)")
+    p.set_defaults(run=stages)
+
+    p = commands.add_parser("compare", help="fail if a stage regressed past the threshold")
+    p.add_argument("baseline")
+    p.add_argument("current")
+    p.add_argument("--threshold", type=float, default=0.2)
+    p.set_defaults(run=compare)
+
+    args = parser.parse_args(argv)
+    return args.run(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
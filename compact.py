@@ -0,0 +1,246 @@
+"""
+Smaller variants of a trained forest for latency- and memory-bound devices.
+
+    python -m compact --model model.joblib --data data_banknote_authentication.txt
+
+Builds truncated forests, depth-capped forests and models distilled
+from the forest (a single shallow tree, logistic regression), measures
+accuracy, memory size and single-note latency of each, optionally as a
+flat forest too, and writes them with a manifest.json. CurrencyDetector
+loads the most accurate variant that fits latency_budget_ms when given
+the manifest as its model path, and a cascade stage lets a tiny tree
+answer the easy notes before the full forest:
+
+    CurrencyDetector("models/compact/manifest.json", latency_budget_ms=0.5)
+    CurrencyDetector(MODEL_PATH, cascade_path="models/compact/cascade-stage.joblib")
+"""
+import argparse
+import copy
+import json
+import os
+import pickle
+import shutil
+import sys
+import time
+
+import numpy as np
+
+from instrumentation import single_note_latency
+
+MANIFEST = "manifest.json"
+CASCADE_STAGE = "cascade-stage.joblib"
+# Early-exit thresholds tried when tuning the cascade
+CASCADE_THRESHOLDS = (0.8, 0.85, 0.9, 0.95, 0.97, 0.99, 0.995, 1.0)
+TREE_COUNTS = (5, 10, 25, 50)
+DEPTHS = (3, 5, 8)
+# Extra synthetic points per training row used when distilling
+DISTILL_AUGMENT = 4
+
+
+def truncate_forest(forest, n_trees):
+    """Copy of a fitted forest that keeps only its first n_trees trees"""
+    small = copy.copy(forest)
+    small.estimators_ = forest.estimators_[:n_trees]
+    small.n_estimators = len(small.estimators_)
+    return small
+
+
+def distillation_set(teacher, X, seed=42):
+    """Training rows plus jittered copies, labelled by the teacher"""
+    rng = np.random.default_rng(seed)
+    scale = X.std(axis=0) * 0.1
+    jitter = [X + rng.normal(0, scale, X.shape) for _ in range(DISTILL_AUGMENT)]
+    X_aug = np.vstack([X] + jitter)
+    return X_aug, teacher.predict(X_aug)
+
+
+def build_variants(teacher, X_train, y_train, seed=42):
+    """Return {name: model} for every compact variant of teacher"""
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.tree import DecisionTreeClassifier
+
+    variants = {"full": teacher}
+    for n in TREE_COUNTS:
+        if n < len(teacher.estimators_):
+            variants[f"trees-{n}"] = truncate_forest(teacher, n)
+    for depth in DEPTHS:
+        variants[f"forest-depth-{depth}"] = RandomForestClassifier(
+            n_estimators=25, max_depth=depth, random_state=seed
+        ).fit(X_train, y_train)
+
+    X_aug, y_aug = distillation_set(teacher, X_train, seed)
+    for depth in DEPTHS:
+        variants[f"distilled-tree-{depth}"] = DecisionTreeClassifier(
+            max_depth=depth, random_state=seed
+        ).fit(X_aug, y_aug)
+    variants["distilled-logistic"] = make_pipeline(
+        StandardScaler(), LogisticRegression(max_iter=1000)
+    ).fit(X_aug, y_aug)
+    return variants
+
+
+def build_cascade_stage(teacher, X_train, seed=42, depth=6, min_samples_leaf=20,
+                        min_agreement=0.99):
+    """
+    Cheap first cascade stage: a shallow tree distilled from the forest.
+    Its leaf frequencies estimate how often the forest agrees, and the
+    early-exit threshold is calibrated on training rows held out from
+    the distillation. Returns (stage, threshold).
+    """
+    from sklearn.model_selection import train_test_split
+    from sklearn.tree import DecisionTreeClassifier
+    X_fit, X_calib = train_test_split(X_train, test_size=0.25, random_state=seed)
+    X_aug, y_aug = distillation_set(teacher, X_fit, seed)
+    stage = DecisionTreeClassifier(
+        max_depth=depth, min_samples_leaf=min_samples_leaf, random_state=seed
+    ).fit(X_aug, y_aug)
+    threshold = tune_cascade(stage, teacher, X_calib, min_agreement)[0]
+    return stage, threshold
+
+
+def tune_cascade(stage, teacher, X, min_agreement=0.99):
+    """
+    Lowest threshold whose early exits agree with the forest on at least
+    min_agreement of X. Returns (threshold, exit_fraction, agreement).
+    """
+    for threshold in CASCADE_THRESHOLDS:
+        exit_fraction, agreement = cascade_agreement(stage, teacher, X, threshold)
+        if agreement >= min_agreement:
+            return threshold, exit_fraction, agreement
+    return 1.01, 0.0, 1.0
+
+
+def cascade_agreement(stage, teacher, X, threshold):
+    """Fraction of X exiting early at threshold and their agreement with the forest"""
+    p = stage.predict_proba(X)
+    early = p.max(axis=1) >= threshold
+    if not early.any():
+        return 0.0, 1.0
+    agrees = stage.classes_[np.argmax(p[early], axis=1)] == teacher.predict(X[early])
+    return float(early.mean()), float(agrees.mean())
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def evaluate(model, teacher, X_test, y_test):
+    pred = model.predict(X_test)
+    return {
+        "accuracy": float(np.mean(pred == y_test)),
+        "agreement": float(np.mean(pred == teacher.predict(X_test))),
+        "latency_ms": single_note_latency(model, X_test, repeat=200) * 1000,
+    }
+
+
+def compact(teacher, X, y, output_dir, metadata=None, flat=True, seed=42):
+    """
+    Build, evaluate and save every variant. Returns the manifest dict,
+    also written to output_dir/manifest.json.
+    """
+    import joblib
+    from sklearn.model_selection import train_test_split
+    from flat_forest import FlatForest, export_forest
+
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=seed)
+    feature_settings = (metadata or {}).get("features")
+    os.makedirs(output_dir, exist_ok=True)
+
+    entries = []
+    for name, model in build_variants(teacher, X_train, y_train, seed).items():
+        path = name + ".joblib"
+        joblib.dump(model, os.path.join(output_dir, path))
+        if feature_settings:
+            with open(os.path.join(output_dir, name + ".json"), "w") as f:
+                json.dump({"features": feature_settings, "variant": name}, f, indent=2)
+        entry = {"name": name, "path": path, "format": "joblib",
+                 "size_bytes": len(pickle.dumps(model))}
+        entry.update(evaluate(model, teacher, X_test, y_test))
+        entries.append(entry)
+
+        if flat and (hasattr(model, "tree_") or hasattr(model, "estimators_")):
+            flat_path = name + ".forest"
+            target = os.path.join(output_dir, flat_path)
+            shutil.rmtree(target, ignore_errors=True)
+            export_forest(model, target, feature_settings=feature_settings)
+            flat_model = FlatForest(target)
+            flat_entry = {"name": name + "-flat", "path": flat_path, "format": "flat",
+                          "size_bytes": directory_size(target)}
+            flat_entry.update(evaluate(flat_model, teacher, X_test, y_test))
+            entries.append(flat_entry)
+
+    stage, threshold = build_cascade_stage(teacher, X_train, seed)
+    exit_fraction, agreement = cascade_agreement(stage, teacher, X_test, threshold)
+    joblib.dump(stage, os.path.join(output_dir, CASCADE_STAGE))
+    cascade = {"path": CASCADE_STAGE, "threshold": threshold,
+               "exit_fraction": exit_fraction, "agreement": agreement}
+    with open(os.path.join(output_dir, os.path.splitext(CASCADE_STAGE)[0] + ".json"), "w") as f:
+        json.dump(dict(cascade, features=feature_settings), f, indent=2)
+
+    manifest = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "teacher": (metadata or {}).get("version"),
+        "test_samples": int(len(y_test)),
+        "variants": entries,
+        "cascade": cascade,
+    }
+    with open(os.path.join(output_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def is_manifest(path):
+    return path.endswith(".json") and os.path.isfile(path) and "variants" in _read(path)
+
+
+def _read(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def select_variant(manifest_path, latency_budget_ms=None):
+    """
+    Path of the most accurate variant whose measured latency fits the
+    budget (ties go to the smaller model). Raises ValueError when none fits.
+    """
+    manifest = _read(manifest_path)
+    fits = [v for v in manifest["variants"]
+            if latency_budget_ms is None or v["latency_ms"] <= latency_budget_ms]
+    if not fits:
+        raise ValueError(f"no model variant meets the {latency_budget_ms} ms latency budget")
+    best = max(fits, key=lambda v: (v["accuracy"], -v["size_bytes"]))
+    return os.path.join(os.path.dirname(manifest_path), best["path"]), best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build compact variants of a trained forest")
+    parser.add_argument("-m", "--model", default="model.joblib")
+    parser.add_argument("--data", default="data_banknote_authentication.txt",
+                        help="CSV of features with the label in the last column")
+    parser.add_argument("-o", "--output-dir", default=os.path.join("models", "compact"))
+    parser.add_argument("--no-flat", action="store_true", help="skip flat-forest exports")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    import joblib
+    from logic import load_metadata
+    data = np.loadtxt(args.data, delimiter=",")
+    X, y = data[:, :-1], data[:, -1].astype(int)
+    manifest = compact(joblib.load(args.model), X, y, args.output_dir,
+                       load_metadata(args.model), not args.no_flat, args.seed)
+
+    print(f"{'variant':<28}{'accuracy':>10}{'agree':>8}{'size':>10}{'latency':>12}")
+    for v in manifest["variants"]:
+        print(f"{v['name']:<28}{v['accuracy']:>10.4f}{v['agreement']:>8.3f}"
+              f"{v['size_bytes'] / 1024:>8.0f}KB{v['latency_ms']:>10.3f}ms")
+    c = manifest["cascade"]
+    print(f"Cascade stage: threshold {c['threshold']}, {c['exit_fraction']:.1%} early exits, "
+          f"{c['agreement']:.4f} agreement with the forest")
+    print(f"Wrote {os.path.join(args.output_dir, MANIFEST)}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
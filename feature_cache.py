@@ -0,0 +1,160 @@
+import hashlib
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# A disk hit refreshes its LRU timestamp at most this often (seconds), so
+# most hits are read-only for processes sharing the database
+ACCESS_RESOLUTION = 60.0
+
+
+def cache_key(data, params):
+    """Content address for an image: hash of its bytes plus the preprocessing parameters"""
+    h = hashlib.sha256(data)
+    h.update(repr(params).encode())
+    return h.hexdigest()
+
+
+class FeatureCache:
+    """
+    Two-tier cache of extracted feature vectors.
+
+    A bounded in-memory LRU sits in front of an optional SQLite store
+    on disk. The disk store is evicted least-recently-used first once
+    it grows past max_bytes of feature data. The SQLite file may be
+    shared by several processes; a disk error (such as "database is
+    locked") is logged and treated as a miss.
+    """
+
+    def __init__(self, path=None, memory_entries=1024, max_bytes=64 * 1024 * 1024):
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS features ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS features_accessed ON features (accessed)")
+            self.db.commit()
+            self.disk_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM features").fetchone()[0]
+        else:
+            self.disk_bytes = 0
+
+    def get(self, key):
+        """Return the cached feature array for key, or None"""
+        with self.lock:
+            value = self.memory.get(key)
+            if value is not None:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                return value
+
+            if self.db is not None:
+                try:
+                    value = self._disk_get(key)
+                except sqlite3.Error as e:
+                    self._disk_error("read", e)
+                    value = None
+                if value is not None:
+                    self._remember(key, value)
+                    self.disk_hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def _disk_get(self, key):
+        row = self.db.execute("SELECT value, accessed FROM features WHERE key = ?",
+                              (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[1] > ACCESS_RESOLUTION:
+            self.db.execute("UPDATE features SET accessed = ? WHERE key = ?", (now, key))
+            self.db.commit()
+        return np.frombuffer(row[0], dtype=np.float64).reshape(1, -1)
+
+    def _disk_error(self, operation, error):
+        """Log a failed disk operation and leave the database as it was"""
+        self.errors += 1
+        print(f"Feature cache {operation} failed: {error}", file=sys.stderr)
+        try:
+            self.db.rollback()
+        except sqlite3.Error:
+            pass
+
+    def put(self, key, features):
+        """Store a feature array under key in both tiers"""
+        value = np.ascontiguousarray(features, dtype=np.float64).reshape(1, -1)
+        with self.lock:
+            self._remember(key, value)
+            if self.db is None:
+                return
+            blob = value.tobytes()
+            try:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO features (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                    (key, blob, len(blob), time.time()),
+                )
+                # Other processes may share the file: size it from the table
+                self.disk_bytes = self.db.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM features").fetchone()[0]
+                self._evict()
+                self.db.commit()
+            except sqlite3.Error as e:
+                self._disk_error("write", e)
+
+    def _remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def _evict(self):
+        """Drop least recently used disk entries until under max_bytes"""
+        while self.disk_bytes > self.max_bytes:
+            rows = self.db.execute(
+                "SELECT key, size FROM features ORDER BY accessed LIMIT 64"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self.db.execute("DELETE FROM features WHERE key = ?", (key,))
+                self.memory.pop(key, None)
+                self.disk_bytes -= size
+                self.evictions += 1
+                if self.disk_bytes <= self.max_bytes:
+                    break
+
+    def stats(self):
+        """Hit/miss counters and current sizes"""
+        with self.lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "errors": self.errors,
+                "memory_entries": len(self.memory),
+                "disk_bytes": self.disk_bytes,
+            }
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
@@ -0,0 +1,361 @@
+"""
+Append-only columnar feature store for audit and training data.
+
+    python -m feature_store import data_banknote_authentication.txt features.store
+    python -m feature_store info features.store
+    python -m feature_store rescore features.store -m models/banknote-<version>.joblib
+    python -m scan DIR --store features.store       # record every scan
+    python -m train --store features.store          # train on the ground-truth rows
+
+A store is a directory with one raw file per column, appended in bulk
+chunks and read back with np.memmap without any parsing:
+
+    features.f32    N×k float32 feature rows
+    label.i1        int8 class label, -1 when unknown
+    model.i2        int16 index into meta.json "model_versions": the model
+                    that produced the label, 0 ("") for ground truth
+    sha256.bin      32-byte image content hash
+    time.f64        float64 Unix time the row was recorded
+
+meta.json holds the row count, feature names, the extraction settings
+(features.feature_params; null for imported rows) and model versions and is
+replaced atomically after each append, so bytes past the count (a crash
+mid-append) are ignored and overwritten by the next append. A store has
+a single writer; any number of processes may read it. sha256.order is
+a derived index (row order sorted by hash) that any process may
+rebuild; it is validated on load, so a stale or partly written copy is
+ignored, and kept only in memory when the store is read-only. Rows can
+be looked up by image hash (find) and time range (time_range), and
+rescore scores the whole history in one vectorized call.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from fileio import write_json_atomic
+
+META = "meta.json"
+HASH_ORDER = "sha256.order"
+# name -> (file, dtype, values per row; None means one per feature)
+COLUMNS = {
+    "features": ("features.f32", np.dtype("<f4"), None),
+    "label": ("label.i1", np.dtype("i1"), 1),
+    "model": ("model.i2", np.dtype("<i2"), 1),
+    "sha256": ("sha256.bin", np.dtype("S32"), 1),
+    "time": ("time.f64", np.dtype("<f8"), 1),
+}
+UNKNOWN_LABEL = -1
+
+
+def _digest(value):
+    """32-byte digest from raw bytes or a hex string"""
+    if isinstance(value, str):
+        return bytes.fromhex(value)
+    return bytes(value)
+
+
+def _normalized(feature_params):
+    """feature_params as they read back from meta.json (tuples become lists)"""
+    return None if feature_params is None else json.loads(json.dumps(feature_params))
+
+
+def _sorts(order, hashes):
+    """True if order is a permutation of the rows that sorts hashes"""
+    n = len(hashes)
+    if len(order) != n:
+        return False
+    if n == 0:
+        return True
+    if order.min() < 0 or order.max() >= n or np.bincount(order, minlength=n).max() != 1:
+        return False
+    ordered = hashes[order]
+    return bool(np.all(ordered[:-1] <= ordered[1:]))
+
+
+class FeatureStore:
+    """Columns of one store directory; see the module docstring for the layout"""
+
+    def __init__(self, path, feature_names=None, feature_params=None):
+        """
+        Open the store at path, creating it when feature_names are given
+        and it does not exist yet. A writer passes the feature_params its
+        rows were extracted with; rows from other settings are refused.
+        """
+        self.path = path
+        meta_path = os.path.join(path, META)
+        if os.path.isfile(meta_path):
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+            if feature_names is not None and list(feature_names) != self.meta["feature_names"]:
+                raise ValueError(f"{path} stores features {self.meta['feature_names']}, "
+                                 f"not {list(feature_names)}")
+            if feature_params is not None and not self.same_params(feature_params):
+                if self.meta["count"]:
+                    raise ValueError(f"{path} stores features extracted with "
+                                     f"{self.meta.get('feature_params')}, not {feature_params}")
+                # Nothing stored yet: take the settings of the first writer
+                self.meta["feature_params"] = _normalized(feature_params)
+                write_json_atomic(meta_path, self.meta, indent=2)
+        elif feature_names is None:
+            raise FileNotFoundError(f"no feature store at {path}")
+        else:
+            os.makedirs(path, exist_ok=True)
+            self.meta = {
+                "format": 1,
+                "count": 0,
+                "feature_names": list(feature_names),
+                "feature_params": _normalized(feature_params),
+                "model_versions": [""],
+                "time_sorted": True,
+                "last_time": None,
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+            write_json_atomic(meta_path, self.meta, indent=2)
+        self._maps = {}
+        self._hash_order = None
+
+    def __len__(self):
+        return self.meta["count"]
+
+    @property
+    def feature_names(self):
+        return self.meta["feature_names"]
+
+    def same_params(self, feature_params):
+        """True if rows extracted with feature_params match the stored ones"""
+        return self.meta.get("feature_params") == _normalized(feature_params)
+
+    def _width(self, name):
+        width = COLUMNS[name][2]
+        return len(self.feature_names) if width is None else width
+
+    def append(self, features, sha256, labels=None, model_version="", timestamps=None):
+        """
+        Append a chunk of rows. sha256 holds one digest (bytes or hex) per
+        row; labels default to unknown and timestamps to now. Returns the
+        indices of the new rows.
+        """
+        features = np.asarray(features, dtype=np.float32).reshape(-1, len(self.feature_names))
+        n = len(features)
+        if n == 0:
+            return np.arange(0)
+        if model_version not in self.meta["model_versions"]:
+            self.meta["model_versions"].append(model_version)
+        times = np.broadcast_to(
+            np.asarray(time.time() if timestamps is None else timestamps, dtype=np.float64), (n,))
+        values = {
+            "features": features,
+            "label": np.broadcast_to(np.asarray(UNKNOWN_LABEL if labels is None else labels,
+                                                dtype=np.int8), (n,)),
+            "model": np.full(n, self.meta["model_versions"].index(model_version), dtype=np.int16),
+            "sha256": np.array([_digest(h) for h in sha256], dtype="S32"),
+            "time": times,
+        }
+        if len(values["sha256"]) != n:
+            raise ValueError("need one sha256 per row")
+
+        count = self.meta["count"]
+        for name, (filename, dtype, _) in COLUMNS.items():
+            column = os.path.join(self.path, filename)
+            row_bytes = dtype.itemsize * self._width(name)
+            with open(column, "ab") as f:
+                # Drop bytes left behind by an append that never committed
+                if f.tell() != count * row_bytes:
+                    f.truncate(count * row_bytes)
+                f.write(np.ascontiguousarray(values[name], dtype=dtype).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+        last = self.meta["last_time"]
+        self.meta["time_sorted"] = bool(self.meta["time_sorted"]
+                                        and (last is None or times[0] >= last)
+                                        and np.all(np.diff(times) >= 0))
+        self.meta["last_time"] = float(times[-1]) if last is None else max(last, float(times.max()))
+        self.meta["count"] = count + n
+        write_json_atomic(os.path.join(self.path, META), self.meta, indent=2)
+        self._maps.clear()
+        self._hash_order = None
+        return np.arange(count, count + n)
+
+    def column(self, name):
+        """Read-only memory map of one column (N or N×k)"""
+        count = self.meta["count"]
+        cached = self._maps.get(name)
+        if cached is not None:
+            return cached
+        filename, dtype, width = COLUMNS[name]
+        shape = (count, self._width(name)) if width is None else (count,)
+        if count == 0:
+            return np.empty(shape, dtype=dtype)
+        self._maps[name] = np.memmap(os.path.join(self.path, filename), dtype=dtype,
+                                     mode="r", shape=shape)
+        return self._maps[name]
+
+    def features(self):
+        return self.column("features")
+
+    def labels(self):
+        return self.column("label")
+
+    def times(self):
+        return self.column("time")
+
+    def hashes(self):
+        return self.column("sha256")
+
+    def model_versions(self):
+        """Model version string of every row ("" for ground truth)"""
+        return np.array(self.meta["model_versions"], dtype=object)[self.column("model")]
+
+    def _sorted_hashes(self):
+        """
+        Row order sorted by hash (kept on disk and rebuilt after appends)
+        and the hashes in that order.
+        """
+        if self._hash_order is not None:
+            return self._hash_order
+        path = os.path.join(self.path, HASH_ORDER)
+        hashes = self.hashes()
+        order = None
+        if os.path.isfile(path) and os.path.getsize(path) == 8 * len(self):
+            order = np.fromfile(path, dtype="<i8")
+            if not _sorts(order, hashes):
+                order = None
+        if order is None:
+            order = np.argsort(hashes, kind="stable")
+            tmp = f"{path}.tmp-{os.getpid()}"
+            try:
+                order.astype("<i8").tofile(tmp)
+                os.replace(tmp, path)
+            except OSError:
+                # Read-only store: keep the index in memory
+                pass
+        self._hash_order = order, hashes[order]
+        return self._hash_order
+
+    def find(self, sha256):
+        """Indices of the rows recorded for one image hash"""
+        order, hashes = self._sorted_hashes()
+        key = np.array([_digest(sha256)], dtype="S32")
+        lo = np.searchsorted(hashes, key, side="left")[0]
+        hi = np.searchsorted(hashes, key, side="right")[0]
+        return np.sort(order[lo:hi])
+
+    def time_range(self, start=None, end=None):
+        """Indices of the rows recorded in [start, end) (Unix seconds)"""
+        times = self.times()
+        start = -np.inf if start is None else start
+        end = np.inf if end is None else end
+        if self.meta["time_sorted"]:
+            return np.arange(np.searchsorted(times, start, side="left"),
+                             np.searchsorted(times, end, side="left"))
+        return np.flatnonzero((times >= start) & (times < end))
+
+    def training_set(self, ground_truth_only=True):
+        """(X, y) of the labelled rows; by default only ground-truth labels"""
+        labels = self.labels()
+        keep = labels != UNKNOWN_LABEL
+        if ground_truth_only:
+            keep &= self.column("model") == 0
+        return self.features()[keep], np.asarray(labels[keep], dtype=int)
+
+    def rescore(self, detector, rows=None):
+        """
+        Score the stored features with a CurrencyDetector (or any model
+        behind its predict_features) in one vectorized call over the
+        mapped array. Returns (labels, confidences, probabilities).
+        A detector whose extractor, fast_features or reduced_decode
+        differ from the stored settings is refused with ValueError.
+        """
+        stored = self.meta.get("feature_params")
+        if stored is not None and hasattr(detector, "feature_params") and \
+                not self.same_params(detector.feature_params()):
+            raise ValueError(f"{self.path} holds features extracted with {stored}, "
+                             f"not the detector's {detector.feature_params()}")
+        features = self.features() if rows is None else self.features()[rows]
+        return detector.predict_features(features)
+
+
+def import_csv(csv_path, store_path, feature_names=None):
+    """
+    Add a features-plus-label text file (the UCI data) as ground truth.
+    The hash column holds the sha256 of each line, as there is no image.
+    """
+    from features import FEATURE_NAMES
+    with open(csv_path, "rb") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    data = np.loadtxt([line.decode() for line in lines], delimiter=",", ndmin=2)
+    store = FeatureStore(store_path, feature_names or FEATURE_NAMES[:data.shape[1] - 1])
+    store.append(data[:, :-1], [hashlib.sha256(line).digest() for line in lines],
+                 labels=data[:, -1].astype(np.int8))
+    return store
+
+
+def import_command(args):
+    store = import_csv(args.csv, args.store)
+    print(f"{len(store)} rows in {args.store}")
+
+
+def info(args):
+    store = FeatureStore(args.store)
+    print(f"{len(store)} rows of {', '.join(store.feature_names)}")
+    if len(store):
+        versions, counts = np.unique(store.column("model"), return_counts=True)
+        for v, n in zip(versions, counts):
+            name = store.meta["model_versions"][v] or "ground truth"
+            print(f"  {name:<40}{n:>10} rows")
+        times = store.times()
+        print(f"Recorded {time.ctime(times.min())} .. {time.ctime(times.max())}")
+
+
+def rescore(args):
+    from logic import CurrencyDetector
+    store = FeatureStore(args.store)
+    detector = CurrencyDetector(args.model)
+    rows = None
+    if args.since is not None or args.until is not None:
+        rows = store.time_range(args.since, args.until)
+    start = time.perf_counter()
+    labels, _, probabilities = store.rescore(detector, rows)
+    elapsed = time.perf_counter() - start
+    predicted = detector.model.classes_[np.argmax(probabilities, axis=1)]
+    stored = store.labels() if rows is None else store.labels()[rows]
+    known = stored != UNKNOWN_LABEL
+    print(f"Rescored {len(labels)} rows in {elapsed:.3f}s; "
+          f"{int(np.sum(predicted == 1))} FAKE, {int(np.sum(predicted != 1))} REAL")
+    if known.any():
+        changed = int(np.sum(predicted[known] != stored[known]))
+        print(f"{changed} of {int(known.sum())} labelled rows get a different verdict")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Columnar feature store")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("import", help="add a CSV of features and labels as ground truth")
+    p.add_argument("csv")
+    p.add_argument("store")
+    p.set_defaults(run=import_command)
+
+    p = commands.add_parser("info", help="row counts per model version and time span")
+    p.add_argument("store")
+    p.set_defaults(run=info)
+
+    p = commands.add_parser("rescore", help="score stored features with another model")
+    p.add_argument("store")
+    p.add_argument("-m", "--model", default="model.joblib")
+    p.add_argument("--since", type=float, default=None, help="Unix time of the first row")
+    p.add_argument("--until", type=float, default=None, help="Unix time after the last row")
+    p.set_defaults(run=rescore)
+
+    args = parser.parse_args(argv)
+    return args.run(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
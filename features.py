@@ -0,0 +1,323 @@
+"""
+Registry of feature extractors.
+
+Every extractor turns a preprocessed (grayscale, resized) image into a
+fixed-length feature row, and a stack of N such images into an N×k
+matrix in one vectorized call. Extractors with native_resolution set
+get the grayscale image before the resize instead, and a list of
+images of any size. Model artifacts name the extractor they were
+trained with (metadata "features" -> "extractor" and "extractor_options").
+
+    python -m train --extractor wavelet ...
+    python -m train --extractor tiles --tile-grid 3 3 --tile-overlap 0.25 ...
+    python -m train --extractor tiles --rois rois.json ...
+    python -m train --real DIR --fake DIR --revalidate MODEL --extractor sobel-int
+
+tiles uses summed-area tables, so every extra window costs O(1).
+sobel-int drifts from the float64 features (on the samples variance is
+about 7% and entropy about 50% lower; see logic.feature_parity(...,
+integer_magnitude=...)), so revalidate a model before switching to it
+or train with that extractor.
+"""
+import numpy as np
+
+import logic
+
+FEATURE_NAMES = ["variance", "skewness", "kurtosis", "entropy"]
+# Histogram bins for the per-window entropy of TiledExtractor
+TILE_ENTROPY_BINS = 32
+
+
+def batch_moments(x):
+    """Variance, skewness and kurtosis of every row of an N×P array"""
+    x = x - x.mean(axis=1, keepdims=True)
+    sq = x * x
+    m2 = sq.mean(axis=1)
+    m3 = np.einsum("ij,ij->i", sq, x) / x.shape[1]
+    m4 = np.einsum("ij,ij->i", sq, sq) / x.shape[1]
+    return m2, m3 / m2**1.5, m4 / m2**2 - 3
+
+
+def batch_entropy(x, exact=True, bins=logic.ENTROPY_BINS):
+    """
+    Base-2 entropy of every row of an N×P array: over distinct values
+    (exact, as logic.shannon_entropy) or over a fixed-bin histogram.
+    """
+    n, size = x.shape
+    if exact:
+        # H = log2(P) - sum(l * log2(l)) / P over runs of equal sorted
+        # values; runs of length one contribute nothing, so only the
+        # (sparse) repeated values need to be grouped
+        s = np.sort(x, axis=1)
+        repeat = np.zeros(s.shape, dtype=bool)
+        repeat[:, :-1] = s[:, 1:] == s[:, :-1]
+        pos = np.flatnonzero(repeat)
+        ent = np.full(n, np.log2(size))
+        if pos.size:
+            run = np.cumsum(np.r_[True, np.diff(pos) != 1]) - 1
+            lengths = np.bincount(run) + 1
+            rows = pos[np.r_[0, np.flatnonzero(np.diff(run)) + 1]] // size
+            ent -= np.bincount(rows, weights=lengths * np.log2(lengths), minlength=n) / size
+        return ent
+    peak = x.max(axis=1, keepdims=True)
+    peak[peak == 0] = 1.0
+    b = np.minimum((x / peak * bins).astype(np.int64), bins - 1)
+    counts = np.bincount((b + np.arange(n)[:, None] * bins).ravel(), minlength=n * bins)
+    counts = counts.reshape(n, bins)
+    p = counts / size
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return -np.nansum(np.where(counts > 0, p * np.log2(p), 0.0), axis=1)
+
+
+def batch_sobel(stack):
+    """
+    Sobel magnitude of every image of an N×H×W stack with one cv2.Sobel
+    call per direction. The images are stacked into one tall image with
+    a reflected row above and below each, so the result is identical to
+    running cv2.Sobel (BORDER_REFLECT_101) on every image separately.
+    """
+    import cv2
+    n, h, w = stack.shape
+    depth = cv2.CV_32F if stack.dtype == np.float32 else cv2.CV_64F
+    tall = np.pad(stack, ((0, 0), (1, 1), (0, 0)), mode="reflect").reshape(n * (h + 2), w)
+    gx = cv2.Sobel(tall, depth, 1, 0, ksize=logic.SOBEL_KSIZE).reshape(n, h + 2, w)[:, 1:-1]
+    gy = cv2.Sobel(tall, depth, 0, 1, ksize=logic.SOBEL_KSIZE).reshape(n, h + 2, w)[:, 1:-1]
+    return np.hypot(gx, gy)
+
+
+def tile_grid(rows=3, cols=3, overlap=0.0):
+    """
+    Windows of a rows×cols grid as (x0, y0, x1, y1) fractions of the
+    image. overlap widens every tile by that fraction of its size on
+    each side (clipped to the image), so neighbouring tiles overlap.
+    """
+    dx, dy = overlap / cols, overlap / rows
+    return [(max(0.0, c / cols - dx), max(0.0, r / rows - dy),
+             min(1.0, (c + 1) / cols + dx), min(1.0, (r + 1) / rows + dy))
+            for r in range(rows) for c in range(cols)]
+
+
+def pixel_boxes(windows, height, width):
+    """M×4 int array of (y0, y1, x0, x1) pixel bounds, at least one pixel each"""
+    f = np.asarray(windows, dtype=np.float64).reshape(-1, 4)
+    x0 = np.clip(np.round(f[:, 0] * width), 0, width - 1).astype(np.int64)
+    y0 = np.clip(np.round(f[:, 1] * height), 0, height - 1).astype(np.int64)
+    x1 = np.maximum(np.clip(np.round(f[:, 2] * width), 0, width).astype(np.int64), x0 + 1)
+    y1 = np.maximum(np.clip(np.round(f[:, 3] * height), 0, height).astype(np.int64), y0 + 1)
+    return np.column_stack([y0, y1, x0, x1])
+
+
+def window_sums(integral, boxes):
+    """Sum inside every box of a summed-area table from cv2.integral: four lookups per box"""
+    y0, y1, x0, x1 = boxes.T
+    return integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+
+
+def window_features(grad, windows, bins=TILE_ENTROPY_BINS):
+    """
+    Variance, skewness, kurtosis and histogram entropy of grad inside
+    every window, as an M×4 array. One summed-area table per power of
+    the gradient and per occupied histogram bin is built in one pass
+    each; after that every window costs O(1) whatever its size.
+    """
+    import cv2
+    boxes = pixel_boxes(windows, *grad.shape)
+    area = ((boxes[:, 1] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 2])).astype(np.float64)
+
+    # Standardise globally so the fourth-power sums stay well conditioned;
+    # per-window skewness and kurtosis do not depend on it
+    mean = grad.mean(dtype=np.float64)
+    scale = float(grad.std(dtype=np.float64)) or 1.0
+    z = (grad - grad.dtype.type(mean)) / grad.dtype.type(scale)
+    raw = []
+    power = z
+    for k in range(4):
+        raw.append(window_sums(cv2.integral(power, sdepth=cv2.CV_64F), boxes) / area)
+        if k < 3:
+            power = power * z
+    r1, r2, r3, r4 = raw
+    m2 = np.maximum(r2 - r1**2, 0.0)
+    m3 = r3 - 3 * r1 * r2 + 2 * r1**3
+    m4 = r4 - 4 * r1 * r3 + 6 * r1**2 * r2 - 3 * r1**4
+    flat = m2 <= 1e-12
+    m2_safe = np.where(flat, 1.0, m2)
+    skew = np.where(flat, 0.0, m3 / m2_safe**1.5)
+    kurt = np.where(flat, 0.0, m4 / m2_safe**2 - 3)
+
+    peak = float(grad.max()) or 1.0
+    levels = np.minimum(grad * (bins / peak), bins - 1).astype(np.uint8)
+    counts = np.zeros((len(boxes), bins))
+    for b in np.flatnonzero(np.bincount(levels.ravel(), minlength=bins)):
+        counts[:, b] = window_sums(cv2.integral((levels == b).view(np.uint8)), boxes)
+    p = counts / area[:, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ent = -np.sum(np.where(p > 0, p * np.log2(p), 0.0), axis=1)
+    return np.column_stack([m2 * scale**2, skew, kurt, ent])
+
+
+class FeatureExtractor:
+    """Base class: subclasses implement extract_batch"""
+    name = None
+    feature_names = FEATURE_NAMES
+    # Set when the extractor wants the grayscale image before the resize
+    native_resolution = False
+    # Set when the extractor wants 8-bit grayscale instead of float64
+    uint8_input = False
+
+    def __init__(self, fast=False):
+        self.fast = fast
+
+    @property
+    def n_features(self):
+        return len(self.feature_names)
+
+    def options(self):
+        """Constructor options to record in model metadata"""
+        return {}
+
+    def extract(self, img):
+        """1×k feature row for one preprocessed image"""
+        return self.extract_batch(img[None])
+
+    def extract_batch(self, stack):
+        raise NotImplementedError
+
+
+class SobelExtractor(FeatureExtractor):
+    """Moments and entropy of the Sobel gradient magnitude (the original features)"""
+    name = "sobel"
+
+    def extract(self, img):
+        return logic.gradient_features(logic.sobel_magnitude(img), self.fast)
+
+    def extract_batch(self, stack):
+        stack = np.asarray(stack, dtype=np.float32 if self.fast else np.float64)
+        grad = batch_sobel(stack).reshape(len(stack), -1)
+        var, skew, kurt = batch_moments(grad)
+        ent = batch_entropy(grad, exact=not self.fast)
+        return np.column_stack([var, skew, kurt, ent])
+
+
+class IntegerSobelExtractor(FeatureExtractor):
+    """
+    Fixed-point Sobel features: 8-bit grayscale, CV_16S derivatives, an
+    integer magnitude and exact power sums from one bincount. About 10×
+    faster than the float64 path but not numerically compatible with it
+    (the entropy of the quantized gradient is roughly half), so models
+    are trained with it or re-validated first (python -m train --revalidate).
+    """
+    name = "sobel-int"
+    uint8_input = True
+
+    def __init__(self, fast=False, magnitude="alpha-max-beta-min"):
+        super().__init__(fast)
+        self.magnitude = magnitude
+
+    def options(self):
+        return {"magnitude": self.magnitude}
+
+    def extract(self, img):
+        grad = logic.sobel_magnitude_int(logic.to_grayscale_u8(img), self.magnitude)
+        return logic.integer_gradient_features(grad)
+
+    def extract_batch(self, stack):
+        return np.vstack([self.extract(img) for img in stack])
+
+
+class WaveletExtractor(FeatureExtractor):
+    """
+    UCI-style features: moments of the level-1 wavelet approximation
+    and the entropy of the 8-bit image.
+    """
+    name = "wavelet"
+
+    def __init__(self, fast=False, wavelet="haar"):
+        super().__init__(fast)
+        self.wavelet = wavelet
+
+    def options(self):
+        return {"wavelet": self.wavelet}
+
+    def extract_batch(self, stack):
+        import pywt
+        from skimage.util import img_as_float
+        # Scale by dtype: 8-bit grayscale arrives as 0-255, colour as [0, 1]
+        dtype = np.float32 if self.fast else np.float64
+        stack = np.stack([img_as_float(img).astype(dtype, copy=False) for img in stack])
+        approx = pywt.dwt2(stack, self.wavelet, axes=(-2, -1))[0]
+        var, skew, kurt = batch_moments(approx.reshape(len(stack), -1))
+        levels = np.clip(stack * 255.0, 0, 255).astype(np.uint8).reshape(len(stack), -1)
+        ent = batch_entropy(levels.astype(np.float32), exact=True)
+        return np.column_stack([var, skew, kurt, ent])
+
+
+class TiledExtractor(FeatureExtractor):
+    """
+    Moments and histogram entropy of the Sobel gradient per tile of an
+    overlapping grid, or per configured region, at native resolution,
+    where the 400×400 resize would blur away microprint and security
+    threads. Regions are (x0, y0, x1, y1) fractions of the image.
+    """
+    name = "tiles"
+    native_resolution = True
+
+    def __init__(self, fast=False, grid=(3, 3), overlap=0.25, rois=None, bins=TILE_ENTROPY_BINS):
+        super().__init__(fast)
+        self.grid = tuple(grid)
+        self.overlap = overlap
+        self.rois = [tuple(roi) for roi in rois] if rois else None
+        self.bins = bins
+        self.windows = self.rois or tile_grid(*self.grid, overlap)
+        self.feature_names = [f"w{i}_{name}" for i in range(len(self.windows))
+                              for name in FEATURE_NAMES]
+
+    def options(self):
+        return {"grid": list(self.grid), "overlap": self.overlap,
+                "rois": [list(roi) for roi in self.rois] if self.rois else None,
+                "bins": self.bins}
+
+    def extract(self, img):
+        import cv2
+        img = np.asarray(img, dtype=np.float32 if self.fast else np.float64)
+        depth = cv2.CV_32F if self.fast else cv2.CV_64F
+        grad = np.hypot(cv2.Sobel(img, depth, 1, 0, ksize=logic.SOBEL_KSIZE),
+                        cv2.Sobel(img, depth, 0, 1, ksize=logic.SOBEL_KSIZE))
+        return window_features(grad, self.windows, self.bins).reshape(1, -1)
+
+    def extract_batch(self, stack):
+        """stack may be a list: native-resolution images differ in size"""
+        return np.vstack([self.extract(img) for img in stack])
+
+
+EXTRACTORS = {
+    SobelExtractor.name: SobelExtractor,
+    WaveletExtractor.name: WaveletExtractor,
+    IntegerSobelExtractor.name: IntegerSobelExtractor,
+    TiledExtractor.name: TiledExtractor,
+}
+
+
+def register_extractor(cls):
+    """Add an extractor class to the registry (usable as a decorator)"""
+    EXTRACTORS[cls.name] = cls
+    return cls
+
+
+def get_extractor(name="sobel", **options):
+    try:
+        return EXTRACTORS[name](**options)
+    except KeyError:
+        raise ValueError(f"unknown feature extractor {name!r}; "
+                         f"available: {', '.join(sorted(EXTRACTORS))}") from None
+
+
+def feature_params(extractor="sobel", fast_features=False, reduced_decode=False, options=None):
+    """Preprocessing settings that determine the extracted features"""
+    return {
+        "extractor": extractor,
+        "extractor_options": get_extractor(extractor, **(options or {})).options(),
+        "resize_target": list(logic.RESIZE_TARGET),
+        "sobel_ksize": logic.SOBEL_KSIZE,
+        "fast_features": fast_features,
+        "reduced_decode": reduced_decode,
+    }
@@ -0,0 +1,19 @@
+"""
+File helpers shared by modules that keep state on disk.
+"""
+import json
+import os
+
+
+def write_json_atomic(path, data, indent=None):
+    """
+    Write data to path atomically: the temporary file (one per process)
+    is fsynced before it replaces path, so a crash leaves either the old
+    or the new contents, never a truncated file.
+    """
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
@@ -0,0 +1,136 @@
+"""
+Flat, NumPy-array-backed random forest.
+
+export_forest writes the nodes of every tree of a fitted sklearn
+forest into shared feature/threshold/child/value arrays; FlatForest
+memory-maps them and evaluates all trees for all rows at once, so
+loading needs neither joblib nor sklearn.
+
+    python -m flat_forest model.joblib model.forest
+"""
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+
+ARRAYS = ("feature", "threshold", "left", "right", "value", "roots", "classes")
+
+
+def export_forest(model, path, source_version=None, feature_settings=None):
+    """
+    Write a fitted sklearn forest (or single tree) to the directory path.
+    feature_settings is the "features" entry of the training metadata.
+    """
+    estimators = getattr(model, "estimators_", [model])
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in estimators:
+        tree = estimator.tree_
+        n = tree.node_count
+        node_ids = np.arange(n, dtype=np.int64) + offset
+        leaf = tree.children_left == -1
+        # Leaves point at themselves so extra traversal steps are no-ops
+        lefts.append(np.where(leaf, node_ids, tree.children_left + offset))
+        rights.append(np.where(leaf, node_ids, tree.children_right + offset))
+        features.append(np.where(leaf, 0, tree.feature))
+        thresholds.append(np.where(leaf, np.inf, tree.threshold))
+        value = tree.value[:, 0, :].astype(np.float64)
+        values.append(value / value.sum(axis=1, keepdims=True))
+        roots.append(offset)
+        offset += n
+        max_depth = max(max_depth, tree.max_depth)
+
+    os.makedirs(path, exist_ok=True)
+    arrays = {
+        "feature": np.concatenate(features).astype(np.int32),
+        "threshold": np.concatenate(thresholds).astype(np.float64),
+        "left": np.concatenate(lefts).astype(np.int32),
+        "right": np.concatenate(rights).astype(np.int32),
+        "value": np.concatenate(values),
+        "roots": np.array(roots, dtype=np.int32),
+        "classes": np.asarray(model.classes_),
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(path, name + ".npy"), array)
+
+    meta = {
+        "format": "flat-forest-1",
+        "n_trees": len(estimators),
+        "n_nodes": offset,
+        "max_depth": int(max_depth),
+        "n_features": int(model.n_features_in_),
+        "source_version": source_version,
+        "features": feature_settings or {"extractor": "sobel"},
+    }
+    # Content hash of the metadata and every array, so different forests
+    # of the same shape get different versions
+    digest = hashlib.sha256(json.dumps(meta, sort_keys=True).encode())
+    for name in sorted(arrays):
+        array = np.ascontiguousarray(arrays[name])
+        digest.update(f"{name}:{array.dtype.str}:{array.shape}".encode())
+        digest.update(array.tobytes())
+    meta["version"] = digest.hexdigest()[:16]
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+class FlatForest:
+    """
+    Drop-in replacement for the predict/predict_proba/classes_ surface
+    of a RandomForestClassifier, evaluated by vectorized traversal.
+    """
+
+    def __init__(self, path, mmap=True):
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        mode = "r" if mmap else None
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, name + ".npy"), mmap_mode=mode))
+        self.classes_ = np.asarray(self.classes)
+        self.n_features_in_ = self.meta["n_features"]
+        self.max_depth = self.meta["max_depth"]
+
+    def apply(self, X):
+        """Return the N×T leaf index reached by every row in every tree"""
+        # sklearn compares float32 features against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(X.shape[0])[:, None]
+        idx = np.broadcast_to(self.roots, (X.shape[0], self.roots.shape[0]))
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[idx]] <= self.threshold[idx]
+            idx = np.where(go_left, self.left[idx], self.right[idx])
+        return idx
+
+    def predict_proba(self, X):
+        return self.value[self.apply(X)].mean(axis=1)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def is_flat_forest(path):
+    return os.path.isfile(os.path.join(path, "meta.json"))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2:
+        print("usage: python -m flat_forest MODEL.joblib OUTPUT_DIR")
+        return 2
+    import joblib
+    from logic import load_metadata
+    model_path, output = argv
+    with open(model_path, "rb") as f:
+        source_version = hashlib.sha256(f.read()).hexdigest()[:16]
+    features = load_metadata(model_path).get("features")
+    meta = export_forest(joblib.load(model_path), output, source_version, features)
+    print(f"Exported {meta['n_trees']} trees ({meta['n_nodes']} nodes) to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
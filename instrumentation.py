@@ -0,0 +1,174 @@
+import contextlib
+import cProfile
+import io
+import json
+import pstats
+import statistics
+import threading
+import time
+import tracemalloc
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Returned by no_stage so disabled instrumentation costs one call
+_NO_STAGE = contextlib.nullcontext()
+
+
+def no_stage(name):
+    """Stage timer used while instrumentation is disabled"""
+    return _NO_STAGE
+
+
+class StageStats:
+    """Count, sum, extremes and a cumulative latency histogram for one stage"""
+    __slots__ = ("count", "total", "min", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total_s": self.total,
+            "mean_s": self.total / self.count if self.count else 0.0,
+            "min_s": self.min if self.count else 0.0,
+            "max_s": self.max,
+            "buckets": dict(zip([str(b) for b in BUCKETS] + ["+Inf"], self.buckets)),
+        }
+
+
+class _Timer:
+    __slots__ = ("stats", "lock", "start")
+
+    def __init__(self, stats, lock):
+        self.stats = stats
+        self.lock = lock
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        with self.lock:
+            self.stats.add(elapsed)
+        return False
+
+
+class Instrumentation:
+    """Per-stage timers and counters with JSON and Prometheus text export"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.counters = {}
+
+    def stage(self, name):
+        """Context manager that times one execution of a pipeline stage"""
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages.setdefault(name, StageStats())
+        return _Timer(stats, self.lock)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def reset(self):
+        with self.lock:
+            self.stages.clear()
+            self.counters.clear()
+
+    def snapshot(self):
+        """Plain-dict copy of every stage and counter"""
+        with self.lock:
+            return {
+                "stages": {name: stats.to_dict() for name, stats in self.stages.items()},
+                "counters": dict(self.counters),
+            }
+
+    def to_json(self, extra=None):
+        snapshot = self.snapshot()
+        if extra:
+            snapshot.update(extra)
+        return json.dumps(snapshot, indent=2)
+
+    def to_prometheus(self, prefix="banknote"):
+        """Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = [f"# TYPE {prefix}_stage_seconds histogram"]
+        for name, stats in snapshot["stages"].items():
+            cumulative = 0
+            for bound, n in stats["buckets"].items():
+                cumulative += n
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {stats["total_s"]}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {stats["count"]}')
+        for name, value in snapshot["counters"].items():
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+
+def single_note_latency(model, X, repeat=50):
+    """Median seconds for one predict_proba call on a single row"""
+    row = X[:1]
+    model.predict_proba(row)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        model.predict_proba(row)
+        times.append(time.perf_counter() - start)
+    return float(statistics.median(times))
+
+
+def profile_call(func, *args, cprofile=True, memory=True, top=20, **kwargs):
+    """
+    Run func once under cProfile and/or tracemalloc.
+    Returns (result, report) where report holds the profiler text,
+    peak traced memory and the largest allocation sites.
+    """
+    report = {}
+    profiler = cProfile.Profile() if cprofile else None
+    started_tracing = memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    try:
+        if profiler is not None:
+            profiler.enable()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+        if memory:
+            snapshot = tracemalloc.take_snapshot()
+            report["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+            report["top_allocations"] = [str(s) for s in snapshot.statistics("lineno")[:top]]
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+    if profiler is not None:
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(top)
+        report["cprofile"] = out.getvalue()
+    return result, report
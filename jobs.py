@@ -0,0 +1,391 @@
+"""
+Resumable, sharded batch scoring for large audit runs.
+
+    python -m jobs plan scans/ audit-job --shard-size 1000     # or a manifest .txt
+    python -m jobs run audit-job -m model.joblib                 # start any number of these
+    python -m jobs status audit-job
+    python -m jobs merge audit-job audit.csv
+
+plan streams the image list (a directory walk or a text manifest with
+one path per line) into shard files of shard_size paths without holding
+the list in memory. Every run process claims one unfinished shard at a
+time with a lease file created with O_EXCL, scores it chunk by chunk and
+checkpoints after every chunk, so a worker killed mid-shard (OOM, reboot)
+loses at most one chunk. A lease that has not been renewed for
+lease_seconds is taken over by the next worker, which resumes from the
+checkpoint. Workers on several hosts can share the job directory; only
+the filesystem is needed, and their clocks must roughly agree.
+
+Job directory layout:
+
+    job.json                    settings and shard count
+    shards/000000.txt           image paths of each shard
+    leases/000000.lease         current owner and expiry of a shard
+    out/000000.partial-<worker>.csv   rows written so far by the lease owner, with
+    out/000000.ckpt.json        the file, lines and bytes they cover
+    out/000000.csv              finished output (its presence marks the shard done)
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import socket
+import sys
+import time
+
+from fileio import write_json_atomic
+from scan import ResultWriter, chunked, find_images, score_paths
+
+MODEL_PATH = "model.joblib"
+LEASE_SECONDS = 600
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def iter_manifest(source):
+    """Yield image paths from a directory tree or a manifest file, lazily"""
+    if os.path.isdir(source):
+        yield from find_images(source)
+        return
+    with open(source) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+
+
+def plan(source, job_dir, shard_size=1000, model_path=MODEL_PATH):
+    """Split the images of source into shard files under job_dir; returns the shard count"""
+    if os.path.exists(os.path.join(job_dir, "job.json")):
+        raise FileExistsError(f"{job_dir} already holds a job")
+    for sub in ("shards", "leases", "out"):
+        os.makedirs(os.path.join(job_dir, sub), exist_ok=True)
+    shards = 0
+    images = 0
+    for shard, paths in enumerate(chunked(iter_manifest(source), shard_size)):
+        with open(os.path.join(job_dir, "shards", f"{shard:06d}.txt"), "w") as f:
+            f.write("\n".join(paths) + "\n")
+        shards = shard + 1
+        images += len(paths)
+    write_json_atomic(os.path.join(job_dir, "job.json"), {
+        "source": source,
+        "model": model_path,
+        "shard_size": shard_size,
+        "shards": shards,
+        "images": images,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    })
+    return shards
+
+
+class Lease:
+    """
+    Exclusive claim on one shard: a lease file created with O_EXCL that
+    names the owner and an expiry, renewed as the shard makes progress.
+    """
+
+    def __init__(self, path, owner, seconds=LEASE_SECONDS):
+        self.path = path
+        self.owner = owner
+        self.seconds = seconds
+
+    def _record(self):
+        return {"owner": self.owner, "expires": time.time() + self.seconds}
+
+    def acquire(self):
+        """True if the shard is now ours, taking over an expired lease"""
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            if not self.expired():
+                return False
+            # Only one worker wins the rename of a stale lease; the
+            # others find the path gone
+            stale = f"{self.path}.stale-{self.owner}"
+            try:
+                os.rename(self.path, stale)
+            except FileNotFoundError:
+                return False
+            if not _lease_expired(stale, self.seconds):
+                # A fresh lease replaced the stale one after the check
+                _restore(stale, self.path)
+                return False
+            os.remove(stale)
+            return self.acquire()
+        with os.fdopen(fd, "w") as f:
+            json.dump(self._record(), f)
+        return True
+
+    def expired(self):
+        """True if the lease on disk has run out (or was never completed)"""
+        return _lease_expired(self.path, self.seconds)
+
+    def renew(self):
+        """
+        Extend the lease; False if another worker has taken it over or
+        it has already expired. The lease is moved aside while it is
+        rewritten, so a successor's lease is never overwritten.
+        """
+        held = _read_json(self.path)
+        if held is None or held["owner"] != self.owner or held["expires"] <= time.time():
+            return False
+        claimed = f"{self.path}.renew-{self.owner}"
+        try:
+            os.rename(self.path, claimed)
+        except FileNotFoundError:
+            return False
+        held = _read_json(claimed)
+        if held is None or held["owner"] != self.owner:
+            _restore(claimed, self.path)
+            return False
+        write_json_atomic(claimed, self._record())
+        try:
+            os.link(claimed, self.path)
+        except FileExistsError:
+            # Another worker claimed the shard while the lease was aside
+            os.remove(claimed)
+            return False
+        os.remove(claimed)
+        return True
+
+    def release(self):
+        held = _read_json(self.path)
+        if held is not None and held["owner"] == self.owner:
+            os.remove(self.path)
+
+
+def _lease_expired(path, seconds):
+    """True if the lease file at path has run out (or was never completed)"""
+    held = _read_json(path)
+    if held is not None:
+        return held["expires"] <= time.time()
+    try:
+        # Still being written by its creator, or left empty by a crash
+        return os.path.getmtime(path) + seconds <= time.time()
+    except FileNotFoundError:
+        return True
+
+
+def _restore(moved, path):
+    """Put a lease moved aside back at path unless a new one is already there"""
+    try:
+        os.link(moved, path)
+    except FileExistsError:
+        pass
+    os.remove(moved)
+
+
+class LeaseLost(Exception):
+    """Another worker took over the shard being processed"""
+
+
+def _shard_paths(job_dir, shard):
+    name = f"{shard:06d}"
+    return {
+        "input": os.path.join(job_dir, "shards", name + ".txt"),
+        "lease": os.path.join(job_dir, "leases", name + ".lease"),
+        "partial": os.path.join(job_dir, "out", name + ".partial-{owner}.csv"),
+        "checkpoint": os.path.join(job_dir, "out", name + ".ckpt.json"),
+        "output": os.path.join(job_dir, "out", name + ".csv"),
+    }
+
+
+def _resume_partial(paths, owner):
+    """
+    Start this owner's partial output from the rows of the last
+    checkpoint. Each owner writes its own file, so a worker that lost
+    its lease but is still running cannot interleave rows with its
+    successor. Returns (checkpoint, partial path, previous owner's path).
+    """
+    checkpoint = _read_json(paths["checkpoint"]) or {"lines": 0, "bytes": 0}
+    partial = paths["partial"].format(owner=owner)
+    previous = checkpoint.get("partial")
+    if previous is not None and not os.path.exists(previous):
+        # Checkpointed rows are gone: start the shard over
+        checkpoint = {"lines": 0, "bytes": 0}
+        previous = None
+    if previous is not None and previous != partial:
+        with open(previous, "rb") as src, open(partial, "wb") as dst:
+            dst.write(src.read(checkpoint["bytes"]))
+    else:
+        with open(partial, "ab") as f:
+            # Drop rows written after the last checkpoint
+            f.truncate(checkpoint["bytes"])
+        previous = None
+    return checkpoint, partial, previous
+
+
+def process_shard(detector, paths, lease, chunk_size=64):
+    """
+    Score one claimed shard from its last checkpoint on. Images are read
+    from the shard file chunk_size at a time; after each chunk the rows
+    are fsynced, the lease is renewed and the checkpoint rewritten.
+    Returns the number of images scored by this call.
+    """
+    checkpoint, partial, previous = _resume_partial(paths, lease.owner)
+    writer = ResultWriter(partial, detector.extractor.feature_names, append=True)
+    done = 0
+    try:
+        with open(paths["input"]) as f:
+            images = (line.rstrip("\n") for line in f if line.strip())
+            for chunk in chunked(itertools.islice(images, checkpoint["lines"], None), chunk_size):
+                rows = score_paths(detector, chunk)[0]
+                for row in rows:
+                    writer.write(row)
+                checkpoint = {"lines": checkpoint["lines"] + len(chunk), "bytes": writer.sync(),
+                              "partial": partial}
+                if not lease.renew():
+                    raise LeaseLost(paths["input"])
+                write_json_atomic(paths["checkpoint"], checkpoint)
+                done += len(chunk)
+    finally:
+        writer.close()
+    os.replace(partial, paths["output"])
+    for leftover in (paths["checkpoint"], previous):
+        if leftover and os.path.exists(leftover):
+            os.remove(leftover)
+    return done
+
+
+def worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def run(job_dir, model_path=None, chunk_size=64, lease_seconds=LEASE_SECONDS, cache_path=None):
+    """
+    Claim and process unfinished shards until none is left to claim.
+    Returns (shards finished, images scored) by this worker.
+    """
+    from logic import CurrencyDetector
+    job = _read_json(os.path.join(job_dir, "job.json"))
+    if job is None:
+        raise FileNotFoundError(f"no job in {job_dir}; run 'python -m jobs plan' first")
+    cache = None
+    if cache_path is not None:
+        from feature_cache import FeatureCache
+        cache = FeatureCache(cache_path)
+    detector = CurrencyDetector(model_path or job["model"], cache=cache)
+    owner = worker_id()
+    finished = images = 0
+    progress = True
+    while progress:
+        progress = False
+        for shard in range(job["shards"]):
+            paths = _shard_paths(job_dir, shard)
+            if os.path.exists(paths["output"]):
+                continue
+            lease = Lease(paths["lease"], owner, lease_seconds)
+            if not lease.acquire():
+                continue
+            try:
+                if os.path.exists(paths["output"]):
+                    continue
+                start = time.perf_counter()
+                n = process_shard(detector, paths, lease, chunk_size)
+                print(f"[{owner}] shard {shard}: {n} images in {time.perf_counter() - start:.1f}s")
+                finished += 1
+                images += n
+                progress = True
+            except LeaseLost:
+                print(f"[{owner}] shard {shard}: lease taken over, moving on")
+            finally:
+                lease.release()
+    return finished, images
+
+
+def status(job_dir):
+    """Count shards by state: done, running, stale (expired lease) and pending"""
+    job = _read_json(os.path.join(job_dir, "job.json"))
+    counts = {"done": 0, "running": 0, "stale": 0, "pending": 0}
+    now = time.time()
+    for shard in range(job["shards"]):
+        paths = _shard_paths(job_dir, shard)
+        if os.path.exists(paths["output"]):
+            counts["done"] += 1
+            continue
+        held = _read_json(paths["lease"]) if os.path.exists(paths["lease"]) else None
+        if held is None:
+            counts["pending"] += 1
+        elif held["expires"] > now:
+            counts["running"] += 1
+        else:
+            counts["stale"] += 1
+    return job, counts
+
+
+def merge(job_dir, output):
+    """Concatenate the finished shard outputs, in shard order, into one CSV"""
+    job = _read_json(os.path.join(job_dir, "job.json"))
+    rows = 0
+    with open(output, "w", newline="") as out:
+        writer = csv.writer(out)
+        for shard in range(job["shards"]):
+            path = _shard_paths(job_dir, shard)["output"]
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"shard {shard} is not finished")
+            with open(path, newline="") as f:
+                # Count records, not lines: a quoted error message may span lines
+                records = csv.reader(f)
+                header = next(records, None)
+                if shard == 0 and header is not None:
+                    writer.writerow(header)
+                for record in records:
+                    writer.writerow(record)
+                    rows += 1
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resumable sharded batch scoring")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("plan", help="split a directory or manifest into shards")
+    p.add_argument("source", help="directory to walk or text file with one image path per line")
+    p.add_argument("job_dir")
+    p.add_argument("--shard-size", type=int, default=1000)
+    p.add_argument("-m", "--model", default=MODEL_PATH)
+
+    p = commands.add_parser("run", help="claim and process shards until none are left")
+    p.add_argument("job_dir")
+    p.add_argument("-m", "--model", default=None, help="override the model named in job.json")
+    p.add_argument("--chunk-size", type=int, default=64, help="images scored per model call")
+    p.add_argument("--lease-seconds", type=float, default=LEASE_SECONDS,
+                   help="lease lifetime without progress before another worker may take over")
+    p.add_argument("--cache", default=None, help="SQLite feature cache")
+
+    p = commands.add_parser("status", help="count done, running, stale and pending shards")
+    p.add_argument("job_dir")
+
+    p = commands.add_parser("merge", help="concatenate finished shard outputs")
+    p.add_argument("job_dir")
+    p.add_argument("output")
+
+    args = parser.parse_args(argv)
+    if args.command == "plan":
+        shards = plan(args.source, args.job_dir, args.shard_size, args.model)
+        print(f"Planned {shards} shards in {args.job_dir}")
+    elif args.command == "run":
+        finished, images = run(args.job_dir, args.model, args.chunk_size, args.lease_seconds,
+                               args.cache)
+        job, counts = status(args.job_dir)
+        print(f"Finished {finished} shards ({images} images); "
+              f"{counts['done']}/{job['shards']} shards done")
+    elif args.command == "status":
+        job, counts = status(args.job_dir)
+        print(f"{job['images']} images in {job['shards']} shards: " +
+              ", ".join(f"{n} {state}" for state, n in counts.items()))
+    else:
+        rows = merge(args.job_dir, args.output)
+        print(f"Wrote {rows} rows to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
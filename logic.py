@@ -1,20 +1,573 @@
+import hashlib
+import json
+import os
 import numpy as np
 import cv2
-from skimage.color import rgb2gray
-from skimage import io
-from skimage.measure import shannon_entropy
-import joblib
+from instrumentation import Instrumentation, no_stage, profile_call
+
+# skimage and joblib are imported where they are used: together they
+# pull in scipy and add most of a second to startup
+
+# Preprocessing parameters shared by every pipeline entry point
+RESIZE_TARGET = (400, 400)
+SOBEL_KSIZE = 3
+# Images preprocessed together per extract_batch call in predict_many
+BATCH_CHUNK = 64
+
+
+def is_path(image):
+    return isinstance(image, (str, os.PathLike))
+
+
+def encoded_buffer(image):
+    """
+    Encoded image bytes (bytes, bytearray, memoryview, a 1-D uint8
+    array or any other buffer of bytes) viewed as a 1-D uint8 array
+    without copying, or None for paths and decoded arrays.
+    """
+    if is_path(image):
+        return None
+    if isinstance(image, np.ndarray):
+        if image.ndim == 1 and image.dtype == np.uint8:
+            return np.ascontiguousarray(image)
+        return None
+    try:
+        view = memoryview(image)
+    except TypeError:
+        return None
+    if view.ndim != 1 or view.itemsize != 1:
+        return None
+    if not view.c_contiguous:
+        view = view.tobytes()
+    return np.frombuffer(view, dtype=np.uint8)
+
+
+def decode_buffer(buf, flags=cv2.IMREAD_UNCHANGED):
+    """
+    Decode an encoded image held in memory with cv2.imdecode.
+    Colour images come back in RGB(A) order like io.imread.
+    """
+    if len(buf) == 0:
+        raise ValueError("empty image buffer")
+    img = cv2.imdecode(buf, flags)
+    if img is None:
+        raise ValueError("could not decode image buffer")
+    if img.ndim == 3 and img.shape[2] == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    elif img.ndim == 3 and img.shape[2] == 4:
+        img = cv2.cvtColor(img, cv2.COLOR_BGRA2RGBA)
+    return img
+
+
+def decode_image(image):
+    """
+    Read a file path, decode encoded bytes or a buffer in memory
+    (including a 1-D uint8 array), or pass an already-decoded array
+    through without copying.
+    """
+    if is_path(image):
+        from skimage import io
+        return io.imread(os.fspath(image))
+    buf = encoded_buffer(image)
+    if buf is not None:
+        return decode_buffer(buf)
+    img = np.asarray(image)
+    if img.ndim < 2:
+        raise ValueError(f"expected an image array with 2 or more dimensions, "
+                         f"got shape {img.shape}; encoded bytes must be uint8")
+    return img
+
+
+# libjpeg can decode straight to 1/2, 1/4 or 1/8 scale. EXIF orientation
+# is ignored, as io.imread and decode_buffer do, so only the scale differs
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8 | cv2.IMREAD_IGNORE_ORIENTATION),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4 | cv2.IMREAD_IGNORE_ORIENTATION),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2 | cv2.IMREAD_IGNORE_ORIENTATION),
+)
+
+
+def decode_reduced_grayscale(path, min_side=min(RESIZE_TARGET)):
+    """
+    Decode a JPEG straight to 8-bit grayscale at the smallest DCT
+    scale factor (2, 4 or 8) that keeps both sides at least min_side
+    pixels, on the same scale as the full decode: colour JPEGs as
+    float64 in [0, 1] (what to_grayscale gives), grayscale ones as
+    uint8. path may also be encoded bytes or a buffer. Other formats and images too small
+    to reduce fall back to a full decode.
+    Features drift from the full decode (JPEG luma weights and less
+    aliasing in the final resize), see feature_parity(..., reduced_decode=True).
+    """
+    from io import BytesIO
+    from PIL import Image
+    buf = encoded_buffer(path)
+    with Image.open(path if buf is None else BytesIO(buf)) as header:
+        fmt = header.format
+        colour = header.mode not in ("L", "1")
+        width, height = header.size
+    if fmt != "JPEG":
+        return to_grayscale(decode_image(path))
+
+    flag = None
+    for factor, reduced in _REDUCED_FLAGS:
+        if min(width, height) // factor >= min_side:
+            flag = reduced
+            break
+    if flag is None:
+        # Too small to reduce: keep the exact full decode
+        return to_grayscale(decode_image(path))
+    img = cv2.imread(os.fspath(path), flag) if buf is None else cv2.imdecode(buf, flag)
+    if img is None:
+        return to_grayscale(decode_image(path))
+    if not colour:
+        # to_grayscale leaves a single-channel decode as uint8
+        return img
+    return img.astype(np.float64) / 255.0
+
+
+def to_grayscale(img):
+    """Convert a colour image to a single channel"""
+    if img.ndim == 3:
+        from skimage.color import rgb2gray
+        img = rgb2gray(img)
+    return img
+
+
+def load_grayscale(image, reduced_decode=False, uint8=False):
+    """
+    Read an image (file path, encoded bytes or buffer, or
+    already-decoded array) and return it as a single-channel array,
+    8-bit if uint8 is set.
+    """
+    if reduced_decode and (is_path(image) or encoded_buffer(image) is not None):
+        img = decode_reduced_grayscale(image)
+    else:
+        img = decode_image(image)
+    return to_grayscale_u8(img) if uint8 else to_grayscale(img)
+
+
+def resize_image(img):
+    """Resize a grayscale image to the training size"""
+    return cv2.resize(img, RESIZE_TARGET)
+
+
+def sobel_magnitude(img):
+    """Sobel gradient magnitude of an already resized image"""
+    sobel_x = cv2.Sobel(img, cv2.CV_64F, 1, 0, ksize=SOBEL_KSIZE)
+    sobel_y = cv2.Sobel(img, cv2.CV_64F, 0, 1, ksize=SOBEL_KSIZE)
+    return np.hypot(sobel_x, sobel_y)
+
+
+def sobel_gradient(img):
+    """Resize a grayscale image and return its Sobel gradient magnitude"""
+    return sobel_magnitude(resize_image(img))
+
+
+# rgb2gray luma weights, applied by cv2.transform on 8-bit images
+GRAY_WEIGHTS = np.array([[0.2125, 0.7154, 0.0721]])
+# Largest integer Sobel magnitude: |gx| + |gy| of a 3×3 kernel on 8-bit input
+INT_GRADIENT_MAX = 2 * 4 * 255
+
+
+def to_grayscale_u8(img):
+    """
+    8-bit single-channel image with the rgb2gray luma weights, computed
+    by cv2.transform without a float64 copy. Float images in [0, 1] are
+    scaled to 0-255.
+    """
+    if img.dtype != np.uint8:
+        img = cv2.convertScaleAbs(img, alpha=255.0 if img.dtype.kind == "f" else 1.0)
+    if img.ndim == 3:
+        img = cv2.transform(np.ascontiguousarray(img[..., :3]), GRAY_WEIGHTS)
+    return img
+
+
+def sobel_magnitude_int(img, magnitude="alpha-max-beta-min"):
+    """
+    Integer Sobel gradient magnitude of a resized uint8 image: CV_16S
+    derivatives (at most ±1020) and an integer magnitude, either
+    |gx| + |gy| ("l1") or max + 3/8 min ("alpha-max-beta-min", within
+    6.8% of the Euclidean norm). Returns an int16 array.
+    """
+    gx = cv2.absdiff(cv2.Sobel(img, cv2.CV_16S, 1, 0, ksize=SOBEL_KSIZE), 0)
+    gy = cv2.absdiff(cv2.Sobel(img, cv2.CV_16S, 0, 1, ksize=SOBEL_KSIZE), 0)
+    if magnitude == "l1":
+        return cv2.add(gx, gy)
+    if magnitude == "alpha-max-beta-min":
+        return cv2.add(cv2.max(gx, gy), (cv2.min(gx, gy) * 3) >> 3)
+    raise ValueError(f"unknown gradient magnitude {magnitude!r}")
+
+
+def integer_gradient_features(grad, scale=255.0):
+    """
+    Variance, skewness, kurtosis and entropy of an integer gradient from
+    one bincount pass. Power sums are exact: each bin's v**4 * count stays
+    below 2**63 for 400×400 images, and the central moments are formed
+    with Python integers before the one division. The variance is
+    divided by scale**2 to match the [0, 1] float pipeline; the entropy
+    is over distinct values, so it is that of the quantized gradient.
+    Returns a 1×4 feature array.
+    """
+    counts = np.bincount(grad.ravel(), minlength=1)
+    values = np.flatnonzero(counts)
+    c = counts[values]
+    n = int(grad.size)
+    # The int64 power sums are exact only while n * max(v)**4 < 2**63
+    top = int(values[-1])
+    assert top <= INT_GRADIENT_MAX and n * top**4 < 2**63, "integer gradient sums would overflow"
+    s1, s2, s3, s4 = (int(np.dot(c, values.astype(np.int64) ** k)) for k in (1, 2, 3, 4))
+    # n**k times the k-th central moment, exact in integers
+    d2 = n * s2 - s1 * s1
+    d3 = n * n * s3 - 3 * n * s1 * s2 + 2 * s1**3
+    d4 = n**3 * s4 - 4 * n * n * s1 * s3 + 6 * n * s1 * s1 * s2 - 3 * s1**4
+    var = d2 / n**2
+    skew = d3 / d2**1.5 if d2 else 0.0
+    kurt = d4 / d2**2 - 3 if d2 else 0.0
+    p = c / n
+    ent = float(-np.sum(p * np.log2(p)))
+    return np.array([[var / scale**2, skew, kurt, ent]])
+
+
+ENTROPY_BINS = 256
+
+
+def shannon_entropy(image):
+    """Base-2 entropy of the distinct values of image, as skimage.measure computes it"""
+    counts = np.unique(image, return_counts=True)[1]
+    p = counts / counts.sum()
+    return float(-np.sum(p * np.log(p)) / np.log(2))
+
+
+def central_moments(grad, exact=True):
+    """
+    Variance, skewness and kurtosis from central power sums of the
+    gradient. The fast mode works in float32; the exact mode keeps
+    float64 and matches the original implementation to rounding error.
+    """
+    g = grad.astype(np.float64 if exact else np.float32).ravel()
+    n = g.size
+    mean = g.sum(dtype=np.float64) / n
+    # Centre in place: one copy of the gradient plus one squared temporary
+    g -= g.dtype.type(mean)
+    sq = g * g
+    m2 = sq.sum(dtype=np.float64) / n
+    m3 = float(np.dot(sq, g)) / n
+    m4 = float(np.dot(sq, sq)) / n
+    return m2, m3 / m2**1.5, m4 / m2**2 - 3
+
+
+def gradient_entropy(grad, exact=True):
+    """
+    Entropy of the gradient: over its distinct values (exact, as in
+    training) or over a fixed-bin histogram (fast).
+    """
+    if exact:
+        return shannon_entropy(grad)
+    peak = float(grad.max())
+    counts = np.histogram(grad, bins=ENTROPY_BINS, range=(0.0, peak or 1.0))[0]
+    p = counts[counts > 0] / grad.size
+    return float(-np.sum(p * np.log2(p)))
+
+
+def gradient_moments(grad, exact=True):
+    """
+    Fused feature kernel: variance, skewness, kurtosis and entropy
+    from central power sums of the gradient. The fast mode works in
+    float32 and uses a fixed-bin histogram for the entropy; the exact
+    mode keeps float64 and the distinct-value entropy of the original
+    implementation, so its output matches it to rounding error.
+    Returns a 1×4 feature array.
+    """
+    var, skew, kurt = central_moments(grad, exact)
+    ent = gradient_entropy(grad, exact)
+    return np.array([[var, skew, kurt, ent]])
+
+
+def reference_features(grad):
+    """Original unfused feature computation, kept for parity checks"""
+    from skimage.measure import shannon_entropy
+    var = np.var(grad)
+    skew = np.mean(((grad - grad.mean())/grad.std())**3)
+    kurt = np.mean(((grad - grad.mean())/grad.std())**4) - 3
+    ent = shannon_entropy(grad)
+    return np.array([[var, skew, kurt, ent]])
+
+
+def gradient_features(grad, fast=False):
+    """
+    Compute variance, skewness, kurtosis and entropy
+    of a gradient image. Returns a 1×4 feature array.
+    """
+    return gradient_moments(grad, exact=not fast)
+
+
+def feature_parity(images, fast=False, reduced_decode=False, integer_magnitude=None):
+    """
+    Compare the fused kernel (and optionally the reduced-resolution
+    decoder, or the integer Sobel path with the given magnitude)
+    against the original implementation on a set of images.
+    Returns the largest absolute and relative difference seen for
+    each of the four features.
+    """
+    abs_diff = np.zeros(4)
+    rel_diff = np.zeros(4)
+    for image in images:
+        grad = sobel_gradient(load_grayscale(image))
+        expected = reference_features(grad)[0]
+        if integer_magnitude is not None:
+            img = resize_image(load_grayscale(image, reduced_decode, uint8=True))
+            actual = integer_gradient_features(sobel_magnitude_int(img, integer_magnitude))[0]
+        else:
+            if reduced_decode:
+                grad = sobel_gradient(load_grayscale(image, reduced_decode=True))
+            actual = gradient_features(grad, fast=fast)[0]
+        diff = np.abs(actual - expected)
+        abs_diff = np.maximum(abs_diff, diff)
+        rel_diff = np.maximum(rel_diff, diff / np.maximum(np.abs(expected), 1e-12))
+    return abs_diff, rel_diff
+
+
+def preprocess(image, extractor, reduced_decode=False, stage=no_stage):
+    """
+    Decode, grayscale and resize one image the way extractor expects:
+    8-bit grayscale for uint8_input extractors, and neither a reduced
+    decode nor a resize for native_resolution ones. Shared by
+    CurrencyDetector, train.py and server.py so every path computes the
+    same features.
+    """
+    reduced_decode = reduced_decode and not extractor.native_resolution
+    with stage("decode"):
+        if reduced_decode and not isinstance(image, np.ndarray):
+            img = load_grayscale(image, reduced_decode=True)
+        else:
+            img = decode_image(image)
+    with stage("grayscale"):
+        img = to_grayscale_u8(img) if extractor.uint8_input else to_grayscale(img)
+    if extractor.native_resolution:
+        return img
+    with stage("resize"):
+        return resize_image(img)
+
+
+def display_gradient(grad):
+    """Normalize a gradient image to uint8 for display"""
+    return (grad * 255.0 / grad.max()).astype(np.uint8)
+
+
+class AnalysisCancelled(Exception):
+    """analyze() stopped early because its cancel token was set"""
+
+
+class AnalysisResult:
+    """Everything produced by a single pass over one banknote image"""
+    __slots__ = ("gradient", "features", "label", "confidence", "probabilities", "stage")
+
+    def __init__(self, gradient, features, label=None, confidence=None, probabilities=None,
+                 stage=None):
+        self.gradient = gradient
+        self.features = features
+        self.label = label
+        self.confidence = confidence
+        self.probabilities = probabilities
+        self.stage = stage
+
+    def __repr__(self):
+        return (f"AnalysisResult(label={self.label!r}, confidence={self.confidence!r}, "
+                f"features={self.features!r})")
+
+
+def load_model(model_path):
+    """
+    Load a joblib model file or an exported flat-forest directory.
+    Returns (model, version, metadata): the version is a short content
+    hash and metadata comes from the training sidecar (<model>.json)
+    or the flat-forest meta.json, or is empty.
+    """
+    from flat_forest import FlatForest, is_flat_forest
+    if os.path.isdir(model_path) and is_flat_forest(model_path):
+        model = FlatForest(model_path)
+        return model, model.meta["version"], model.meta
+    import joblib
+    model = joblib.load(model_path)
+    with open(model_path, "rb") as f:
+        version = hashlib.sha256(f.read()).hexdigest()[:16]
+    return model, version, load_metadata(model_path)
+
+
+def load_metadata(model_path):
+    """Training metadata stored next to a model file, if any"""
+    sidecar = os.path.splitext(model_path)[0] + ".json"
+    if not os.path.isfile(sidecar):
+        return {}
+    with open(sidecar) as f:
+        return json.load(f)
+
+
+def model_metadata(model_path):
+    """
+    Training metadata of a model file, flat-forest directory or compact
+    manifest (of the variant chosen without a latency budget), read
+    without loading the model.
+    """
+    from compact import is_manifest, select_variant
+    from flat_forest import is_flat_forest
+    if is_manifest(model_path):
+        model_path = select_variant(model_path)[0]
+    if os.path.isdir(model_path) and is_flat_forest(model_path):
+        with open(os.path.join(model_path, "meta.json")) as f:
+            return json.load(f)
+    return load_metadata(model_path)
+
 
 class CurrencyDetector:
-    def __init__(self, model_path):
-        """Initialize the detector with a trained model"""
+    def __init__(self, model_path, fast_features=None, cache=None, reduced_decode=None,
+                 extractor=None, latency_budget_ms=None, cascade_path=None,
+                 cascade_threshold=None):
+        """
+        Initialize the detector with a trained model.
+        fast_features selects the float32/histogram feature kernel,
+        which is not numerically identical to the training features.
+        cache is an optional FeatureCache for repeated scans.
+        reduced_decode decodes JPEG files straight to grayscale at
+        reduced resolution instead of full-size RGB.
+        fast_features and reduced_decode default to the settings the
+        model was trained with (metadata "features"), else False.
+        extractor names the feature extractor (see features.py);
+        by default the one recorded in the model metadata (with its
+        options), else sobel.
+        If model_path is a compact-variant manifest (see compact.py), the
+        most accurate variant within latency_budget_ms is loaded.
+        cascade_path names a cheap calibrated first-stage model; notes it
+        scores with confidence >= cascade_threshold skip the full model.
+        """
+        self.cache = cache
+        self.model_version = None
+        self.metrics = None
+        self._stage = no_stage
+        self.metadata = {}
+        self.variant = None
         try:
-            self.model = joblib.load(model_path)
+            from compact import is_manifest, select_variant
+            if is_manifest(model_path):
+                model_path, entry = select_variant(model_path, latency_budget_ms)
+                self.variant = entry["name"]
+            self.model, self.model_version, self.metadata = load_model(model_path)
             print("Loaded model successfully")
         except Exception as e:
             print(f"Error loading model: {e}")
             self.model = None
-            
+
+        self.cascade = None
+        self.cascade_threshold = cascade_threshold
+        self.cascade_stats = {"early_exits": 0, "full_model": 0}
+        if cascade_path is not None:
+            self.load_cascade(cascade_path, cascade_threshold)
+
+        from features import get_extractor
+        settings = self.metadata.get("features", {})
+        if fast_features is None:
+            fast_features = bool(settings.get("fast_features", False))
+        if reduced_decode is None:
+            reduced_decode = bool(settings.get("reduced_decode", False))
+        self.fast_features = fast_features
+        self.reduced_decode = reduced_decode
+        if extractor is None:
+            extractor = settings.get("extractor", "sobel")
+        options = {}
+        if extractor == settings.get("extractor"):
+            options = settings.get("extractor_options") or {}
+        self.extractor = get_extractor(extractor, fast=fast_features, **options)
+
+    def feature_params(self):
+        """Settings that determine this detector's features (see features.feature_params)"""
+        from features import feature_params
+        return feature_params(self.extractor.name, self.fast_features, self.reduced_decode,
+                              self.extractor.options())
+
+    def _cache_key(self, image):
+        """Content address of a file path or encoded-bytes input, or None if it cannot be cached"""
+        if self.cache is None:
+            return None
+        data = encoded_buffer(image)
+        if data is None:
+            if not is_path(image):
+                return None
+            with open(image, "rb") as f:
+                data = f.read()
+        from feature_cache import cache_key
+        params = (RESIZE_TARGET, SOBEL_KSIZE, self.extractor.name, self.extractor.options(),
+                  self.fast_features, self.reduced_decode, self.model_version)
+        return cache_key(data, params)
+
+    def enable_metrics(self):
+        """Start recording per-stage timings and counters"""
+        if self.metrics is None:
+            self.metrics = Instrumentation()
+        self._stage = self.metrics.stage
+        return self.metrics
+
+    def disable_metrics(self):
+        """Stop recording; the last snapshot stays readable"""
+        self._stage = no_stage
+
+    def _count(self, name, n=1):
+        if self._stage is not no_stage:
+            self.metrics.count(name, n)
+
+    def metrics_snapshot(self):
+        """Stage timings, counters and feature-cache statistics"""
+        snapshot = self.metrics.snapshot() if self.metrics is not None else {"stages": {}, "counters": {}}
+        if self.cache is not None:
+            snapshot["cache"] = self.cache.stats()
+        return snapshot
+
+    def profile_request(self, image, cprofile=True, memory=True):
+        """Run analyze on one image under cProfile/tracemalloc; returns (result, report)"""
+        return profile_call(self.analyze, image, cprofile=cprofile, memory=memory)
+
+    def _preprocess(self, image):
+        """Decode, grayscale and resize, timing each stage"""
+        return preprocess(image, self.extractor, self.reduced_decode, self._stage)
+
+    def _display_input(self, img):
+        """Training-size image for the display gradient"""
+        if self.extractor.native_resolution:
+            with self._stage("resize"):
+                return resize_image(img)
+        return img
+
+    def _sobel(self, img):
+        with self._stage("sobel"):
+            return sobel_magnitude(img)
+
+    def _gradient(self, image):
+        """Preprocess and Sobel, timing each stage"""
+        return self._sobel(self._display_input(self._preprocess(image)))
+
+    def _extract(self, img, grad=None):
+        """Features of one preprocessed image with the configured extractor"""
+        if self.extractor.name == "sobel":
+            return self._features(self._sobel(img) if grad is None else grad)
+        with self._stage("features"):
+            return self.extractor.extract(img)
+
+    def _features(self, grad):
+        """Moments and entropy of a gradient, timing each stage"""
+        exact = not self.fast_features
+        with self._stage("moments"):
+            var, skew, kurt = central_moments(grad, exact)
+        with self._stage("entropy"):
+            ent = gradient_entropy(grad, exact)
+        return np.array([[var, skew, kurt, ent]])
+
+    def _cached(self, key):
+        """Cached features for key, counting hits and misses"""
+        if key is None:
+            return None
+        features = self.cache.get(key)
+        self._count("cache_hits" if features is not None else "cache_misses")
+        return features
+
     def extract_sobel_features(self, image_path):
         """
         Load an image from disk, convert to grayscale,
@@ -22,50 +575,183 @@ class CurrencyDetector:
         variance, skewness, kurtosis, and entropy.
         Returns a 1×4 feature list.
         """
-        # 1. Read and grayscale
-        img = io.imread(image_path)
-        if img.ndim == 3:
-            img = rgb2gray(img)
-        # 2. Resize to 400×400 (or your training size)
-        img = cv2.resize(img, (400, 400))
-        # 3. Sobel in X and Y
-        sobel_x = cv2.Sobel(img, cv2.CV_64F, 1, 0, ksize=3)
-        sobel_y = cv2.Sobel(img, cv2.CV_64F, 0, 1, ksize=3)
-        grad = np.hypot(sobel_x, sobel_y)
-        # 4. Compute statistical features
-        var = np.var(grad)
-        skew = np.mean(((grad - grad.mean())/grad.std())**3)
-        kurt = np.mean(((grad - grad.mean())/grad.std())**4) - 3
-        ent = shannon_entropy(grad)
-        return np.array([[var, skew, kurt, ent]])
+        return self.extract_features(image_path)
+
+    def extract_features(self, image):
+        """Feature row of one image with the model's extractor (1×k)"""
+        with self._stage("extract_features"):
+            key = self._cache_key(image)
+            features = self._cached(key)
+            if features is not None:
+                return features
+            features = self._extract(self._preprocess(image))
+            if key is not None:
+                self.cache.put(key, features)
+            return features
+
+    def extract_many(self, images):
+        """
+        N×k feature matrix for a batch of images. Cache misses are
+        preprocessed and passed to the extractor's vectorized
+        extract_batch in chunks of BATCH_CHUNK images.
+        """
+        images = list(images)
+        keys = [self._cache_key(image) for image in images]
+        features = np.empty((len(images), self.extractor.n_features))
+        missing = []
+        for i, key in enumerate(keys):
+            cached = self._cached(key)
+            if cached is not None:
+                features[i] = cached[0]
+            else:
+                missing.append(i)
+
+        for start in range(0, len(missing), BATCH_CHUNK):
+            chunk = missing[start:start + BATCH_CHUNK]
+            stack = [self._preprocess(images[i]) for i in chunk]
+            if not self.extractor.native_resolution:
+                stack = np.stack(stack)
+            with self._stage("extract_batch"):
+                rows = self.extractor.extract_batch(stack)
+            for i, row in zip(chunk, rows):
+                features[i] = row
+                if keys[i] is not None:
+                    self.cache.put(keys[i], row)
+        return features
 
     def process_image(self, image_path):
         """Process image and return edge detection result"""
-        img = io.imread(image_path)
-        if img.ndim == 3:
-            img = rgb2gray(img)
-        img = cv2.resize(img, (400, 400))
-        
-        sobel_x = cv2.Sobel(img, cv2.CV_64F, 1, 0, ksize=3)
-        sobel_y = cv2.Sobel(img, cv2.CV_64F, 0, 1, ksize=3)
-        grad = np.hypot(sobel_x, sobel_y)
-        
-        # Normalize for display
-        grad_norm = (grad * 255.0 / grad.max()).astype(np.uint8)
-        return grad_norm
+        with self._stage("process_image"):
+            grad = self._gradient(image_path)
+            return display_gradient(grad)
+
+    def load_cascade(self, cascade_path, threshold=None):
+        """
+        Load a first-stage model for early exits. The threshold defaults
+        to the one chosen by compact.py, stored in the model's sidecar.
+        """
+        import joblib
+        stage = joblib.load(cascade_path)
+        if threshold is None:
+            threshold = load_metadata(cascade_path).get("threshold", 0.99)
+        if self.model is not None and not np.array_equal(stage.classes_, self.model.classes_):
+            raise ValueError("cascade stage and model disagree on classes")
+        self.cascade = stage
+        self.cascade_threshold = threshold
+
+    def cascade_exit_fraction(self):
+        """Fraction of notes decided by the first cascade stage so far"""
+        total = self.cascade_stats["early_exits"] + self.cascade_stats["full_model"]
+        return self.cascade_stats["early_exits"] / total if total else 0.0
+
+    def _predict(self, features):
+        """
+        Class probabilities plus the stage that decided each row:
+        "cascade" for confident early exits, "model" otherwise.
+        """
+        if self.cascade is None:
+            with self._stage("predict"):
+                return self.model.predict_proba(features), np.full(len(features), "model")
+
+        with self._stage("cascade"):
+            probabilities = self.cascade.predict_proba(features)
+        early = probabilities.max(axis=1) >= self.cascade_threshold
+        hard = ~early
+        if hard.any():
+            with self._stage("predict"):
+                probabilities[hard] = self.model.predict_proba(features[hard])
+        n_early = int(early.sum())
+        self.cascade_stats["early_exits"] += n_early
+        self.cascade_stats["full_model"] += len(features) - n_early
+        self._count("cascade_early_exits", n_early)
+        return probabilities, np.where(early, "cascade", "model")
+
+    def predict_features(self, features, return_stages=False):
+        """
+        Score an N×k feature matrix with a single predict_proba call
+        (or the cascade). Returns (labels, confidences, probabilities),
+        with labels taken from the argmax of the probabilities, plus the
+        deciding stage of each row when return_stages is set.
+        """
+        features = np.asarray(features)
+        probabilities, stages = self._predict(features)
+        self._count("predicted_rows", len(features))
+        predictions = self.model.classes_[np.argmax(probabilities, axis=1)]
+        labels = ["FAKE banknote" if p == 1 else "REAL banknote" for p in predictions]
+        confidences = probabilities.max(axis=1) * 100
+        if return_stages:
+            return labels, confidences, probabilities, stages
+        return labels, confidences, probabilities
+
+    def analyze(self, image, cancel=None):
+        """
+        Decode the image and compute its Sobel gradient once,
+        then derive the display image, features and prediction
+        from that single pass. Returns an AnalysisResult.
+        cancel is an optional threading.Event checked between decode,
+        Sobel and predict; once set, AnalysisCancelled is raised.
+        """
+        with self._stage("analyze"):
+            return self._analyze(image, cancel)
+
+    def _analyze(self, image, cancel=None):
+        def checkpoint():
+            if cancel is not None and cancel.is_set():
+                raise AnalysisCancelled()
+
+        key = self._cache_key(image)
+        img = self._preprocess(image)
+        checkpoint()
+        grad = self._sobel(self._display_input(img))
+        checkpoint()
+        # The display still needs the gradient; a hit skips the features
+        features = self._cached(key)
+        if features is None:
+            features = self._extract(img, grad)
+            if key is not None:
+                self.cache.put(key, features)
+        result = AnalysisResult(display_gradient(grad), features[0])
+        checkpoint()
+        if self.model is not None:
+            labels, confidences, probabilities, stages = self.predict_features(features, True)
+            result.label = labels[0]
+            result.confidence = confidences[0]
+            result.probabilities = probabilities[0]
+            result.stage = stages[0]
+        return result
+
+    def predict_many(self, images):
+        """
+        Score a batch of images (file paths, encoded bytes/buffers or decoded arrays).
+        Features are extracted in batches into one N×k matrix and the model
+        is evaluated once for the whole batch.
+        Returns a list of AnalysisResult without display gradients.
+        """
+        images = list(images)
+        if not images:
+            return []
+        self._count("batches")
+        self._count("batch_images", len(images))
+        features = self.extract_many(images)
+        results = [AnalysisResult(None, row) for row in features]
+        if self.model is not None:
+            labels, confidences, probabilities, stages = self.predict_features(features, True)
+            for i, result in enumerate(results):
+                result.label = labels[i]
+                result.confidence = confidences[i]
+                result.probabilities = probabilities[i]
+                result.stage = stages[i]
+        return results
 
     def predict_banknote(self, image_path):
         """
-        Given a file path, extract Sobel features,
+        Given a file path, encoded bytes or a decoded array, extract Sobel features,
         apply the loaded model, and return prediction details.
         """
         if self.model is None:
             return None, None, None
-            
-        features = self.extract_sobel_features(image_path)
-        prediction = self.model.predict(features)[0]
-        probabilities = self.model.predict_proba(features)[0]
-        confidence = max(probabilities) * 100
-        
-        result = "FAKE banknote" if prediction == 1 else "REAL banknote"
-        return result, confidence, features[0] 
\ No newline at end of file
+
+        with self._stage("predict_banknote"):
+            features = self.extract_features(image_path)
+            labels, confidences, _ = self.predict_features(features)
+            return labels[0], confidences[0], features[0]
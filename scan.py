@@ -0,0 +1,229 @@
+"""
+Headless batch scanner.
+
+Walks a directory tree of banknote images and scores them on a
+process pool. Usage:
+
+    python -m scan sampels/ --output results.csv
+    python -m scan scans/ --store features.store   # also keep every feature row
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+from features import FEATURE_NAMES, get_extractor
+from logic import CurrencyDetector, model_metadata
+
+MODEL_PATH = "model.joblib"
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff")
+
+# Set once per worker process by _init_worker
+_detector = None
+
+
+def find_images(root):
+    """Yield image paths under root, walking subdirectories lazily"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(dirpath, name)
+
+
+def chunked(iterable, size):
+    """Group an iterable into lists of at most size items"""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _init_worker(model_path, cache_path=None):
+    """Load the model (and optional feature cache) once in every worker process"""
+    global _detector
+    cache = None
+    if cache_path is not None:
+        from feature_cache import FeatureCache
+        cache = FeatureCache(cache_path)
+    _detector = CurrencyDetector(model_path, cache=cache)
+
+
+def _score_chunk(paths):
+    """
+    Extract features for a chunk of images and score them in one model
+    call. Returns the result rows plus a batch for the feature store.
+    """
+    rows, ok_paths, features, classes = score_paths(_detector, paths)
+    return rows, _store_batch(ok_paths, features, classes)
+
+
+def score_paths(detector, paths):
+    """
+    Score a chunk of images with one batched extraction and one model
+    call; unreadable images get an error row instead of failing the
+    chunk. Rows follow the order of paths. Returns (rows, scored paths,
+    their features, their classes).
+    """
+    paths = list(paths)
+    errors = {}
+    try:
+        features, ok_paths = list(detector.extract_many(paths)), paths
+    except Exception:
+        # Fall back to one image at a time to isolate unreadable files
+        features, ok_paths = [], []
+        for i, path in enumerate(paths):
+            try:
+                features.append(detector.extract_features(path)[0])
+                ok_paths.append(path)
+            except Exception as e:
+                errors[i] = _error_row(path, e)
+    classes = None
+    names = detector.extractor.feature_names
+    if features and detector.model is not None:
+        labels, confidences, probabilities = detector.predict_features(features)
+        classes = detector.model.classes_[probabilities.argmax(axis=1)]
+        scored = (_row(path, names, feats, label, confidence)
+                  for path, feats, label, confidence in zip(ok_paths, features, labels, confidences))
+    else:
+        scored = (_row(path, names, feats, None, None) for path, feats in zip(ok_paths, features))
+    # Error rows keep their place among the scored ones
+    rows = [errors[i] if i in errors else next(scored) for i in range(len(paths))]
+    return rows, ok_paths, features, classes
+
+
+def _store_batch(paths, features, classes):
+    """Feature-store columns for the scored images of one chunk"""
+    if not paths:
+        return None
+    hashes = []
+    for path in paths:
+        with open(path, "rb") as f:
+            hashes.append(hashlib.sha256(f.read()).digest())
+    return {
+        "features": features,
+        "sha256": hashes,
+        "labels": classes,
+        "model_version": _detector.model_version if classes is not None else "",
+        "feature_names": _detector.extractor.feature_names,
+        "feature_params": _detector.feature_params(),
+    }
+
+
+def _row(path, feature_names, features, label, confidence):
+    row = {
+        "path": path,
+        "label": label,
+        "confidence": None if confidence is None else float(confidence),
+    }
+    row.update(zip(feature_names, map(float, features)))
+    row["error"] = None
+    return row
+
+
+def _error_row(path, error):
+    return {"path": path, "error": str(error)}
+
+
+class ResultWriter:
+    """
+    Stream result rows to CSV or JSONL, chosen by file extension.
+    The CSV has one column per feature of the detector's extractor.
+    """
+
+    def __init__(self, path, feature_names=FEATURE_NAMES, append=False):
+        self.file = open(path, "a" if append else "w", newline="")
+        self.jsonl = path.endswith((".jsonl", ".json"))
+        self.fields = ["path", "label", "confidence"] + list(feature_names) + ["error"]
+        if not self.jsonl:
+            self.csv = csv.DictWriter(self.file, fieldnames=self.fields)
+            if self.file.tell() == 0:
+                self.csv.writeheader()
+
+    def write(self, row):
+        if self.jsonl:
+            self.file.write(json.dumps(row) + "\n")
+        else:
+            self.csv.writerow(row)
+
+    def sync(self):
+        """Flush written rows to disk; returns the file size"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+def model_feature_names(model_path):
+    """Feature names of the extractor a model was trained with, from its metadata"""
+    settings = model_metadata(model_path).get("features", {})
+    extractor = settings.get("extractor", "sobel")
+    return get_extractor(extractor, **(settings.get("extractor_options") or {})).feature_names
+
+
+def scan(root, output, model_path=MODEL_PATH, workers=None, chunk_size=32, cache_path=None,
+         store_path=None):
+    """
+    Score every image under root on a process pool and stream
+    the rows to output as chunks finish. With store_path, every
+    feature row is also appended to that FeatureStore together with
+    its verdict, model version and image hash. Returns (count, seconds).
+    """
+    workers = workers or os.cpu_count() or 1
+    writer = ResultWriter(output, model_feature_names(model_path))
+    store = None
+    count = 0
+    start = time.perf_counter()
+    try:
+        with Pool(workers, initializer=_init_worker, initargs=(model_path, cache_path)) as pool:
+            chunks = chunked(find_images(root), chunk_size)
+            for rows, batch in pool.imap_unordered(_score_chunk, chunks):
+                for row in rows:
+                    writer.write(row)
+                count += len(rows)
+                if store_path is not None and batch is not None:
+                    if store is None:
+                        from feature_store import FeatureStore
+                        store = FeatureStore(store_path, batch["feature_names"],
+                                             batch["feature_params"])
+                    store.append(batch["features"], batch["sha256"], batch["labels"],
+                                 batch["model_version"])
+    finally:
+        writer.close()
+    return count, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch-scan a directory of banknote images")
+    parser.add_argument("root", help="directory to scan recursively")
+    parser.add_argument("-o", "--output", default="scan_results.csv",
+                        help="output .csv or .jsonl file (default: scan_results.csv)")
+    parser.add_argument("-m", "--model", default=MODEL_PATH, help="path to the trained model")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="worker processes (default: number of cores)")
+    parser.add_argument("--chunk-size", type=int, default=32,
+                        help="images dispatched to a worker at a time")
+    parser.add_argument("--cache", default=None,
+                        help="SQLite feature cache so rescans skip unchanged images")
+    parser.add_argument("--store", default=None,
+                        help="feature store directory to append every feature row to")
+    args = parser.parse_args(argv)
+
+    count, elapsed = scan(args.root, args.output, args.model, args.workers, args.chunk_size,
+                          args.cache, args.store)
+    rate = count / elapsed if elapsed else 0.0
+    print(f"Scanned {count} images in {elapsed:.2f}s ({rate:.1f} images/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""
+Local HTTP inference service.
+
+Loads CurrencyDetector once, extracts features on a process pool and
+micro-batches concurrent requests into a single predict_proba call.
+
+    python -m server --port 8080
+    curl --data-binary @"sampels/real money.jpg" http://127.0.0.1:8080/predict
+
+Endpoints: POST /predict (raw image body or multipart upload),
+GET /healthz, GET /metrics.
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from email.parser import BytesParser
+
+import numpy as np
+
+from features import get_extractor
+from logic import CurrencyDetector, preprocess
+
+MODEL_PATH = "model.joblib"
+MAX_BODY = 64 * 1024 * 1024
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+def extract_from_bytes(data, extractor="sobel", fast_features=False, options=None,
+                       reduced_decode=False):
+    """Decode an encoded image held in memory and return its feature row"""
+    extractor = get_extractor(extractor, fast=fast_features, **(options or {}))
+    return extractor.extract(preprocess(data, extractor, reduced_decode))
+
+
+def multipart_file(content_type, body):
+    """Return the payload of the first part of a multipart/form-data body"""
+    message = BytesParser().parsebytes(b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body)
+    for part in message.walk():
+        if not part.is_multipart():
+            return part.get_payload(decode=True)
+    raise ValueError("empty multipart upload")
+
+
+class Metrics:
+    """Request counters and a window of recent latencies"""
+
+    def __init__(self, window=2048):
+        self.started = time.monotonic()
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self.batched_items = 0
+        self.max_batch = 0
+        self.latencies = collections.deque(maxlen=window)
+
+    def record_batch(self, size):
+        self.batches += 1
+        self.batched_items += size
+        self.max_batch = max(self.max_batch, size)
+
+    def snapshot(self):
+        uptime = time.monotonic() - self.started
+        latencies = np.array(self.latencies) * 1000 if self.latencies else np.zeros(1)
+        return {
+            "uptime_s": uptime,
+            "requests": self.requests,
+            "errors": self.errors,
+            "throughput_rps": self.requests / uptime if uptime else 0.0,
+            "latency_ms": {
+                "p50": float(np.percentile(latencies, 50)),
+                "p90": float(np.percentile(latencies, 90)),
+                "p99": float(np.percentile(latencies, 99)),
+                "max": float(latencies.max()),
+            },
+            "batches": self.batches,
+            "mean_batch_size": self.batched_items / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch,
+        }
+
+
+class InferenceServer:
+    """
+    asyncio HTTP front end around one warm CurrencyDetector.
+
+    Requests wait at most max_wait_ms for companions before their
+    features are scored together in batches of up to max_batch rows.
+    """
+
+    def __init__(self, detector, workers=None, max_batch=32, max_wait_ms=5.0):
+        self.detector = detector
+        self.pool = ProcessPoolExecutor(workers or os.cpu_count() or 1)
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.metrics = Metrics()
+        self.pending = None
+
+    async def predict(self, data):
+        """Extract features off the event loop, then join the next batch"""
+        loop = asyncio.get_running_loop()
+        features = await loop.run_in_executor(
+            self.pool, extract_from_bytes, data,
+            self.detector.extractor.name, self.detector.fast_features,
+            self.detector.extractor.options(), self.detector.reduced_decode
+        )
+        future = loop.create_future()
+        await self.pending.put((features, future))
+        return await future
+
+    async def batcher(self):
+        """Collect queued feature rows and score them in one model call"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.pending.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.pending.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            features = np.vstack([item[0] for item in batch])
+            try:
+                labels, confidences, probabilities = await loop.run_in_executor(
+                    None, self.detector.predict_features, features
+                )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.metrics.record_batch(len(batch))
+            for i, (row, future) in enumerate(batch):
+                if not future.done():
+                    future.set_result({
+                        "label": labels[i],
+                        "confidence": float(confidences[i]),
+                        "probabilities": probabilities[i].tolist(),
+                        "features": row[0].tolist(),
+                    })
+
+    async def handle(self, reader, writer):
+        """Serve HTTP/1.1 requests on one connection"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                except ValueError:
+                    await self.respond(writer, 400, {"error": "malformed request line"}, False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    length = int(headers.get("content-length", 0))
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self.respond(writer, 400, {"error": "invalid Content-Length"}, False)
+                    break
+                if length > MAX_BODY:
+                    await self.respond(writer, 413, {"error": "upload too large"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                keep_alive = headers.get("connection", "").lower() != "close"
+
+                status, payload = await self.route(method, target.split("?", 1)[0], headers, body)
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, headers, body):
+        if path == "/healthz":
+            if self.detector.model is None:
+                return 503, {"status": "no model"}
+            return 200, {"status": "ok"}
+        if path == "/metrics":
+            return 200, self.metrics.snapshot()
+        if path != "/predict":
+            return 404, {"error": "not found"}
+        if method != "POST":
+            return 405, {"error": "use POST"}
+        if self.detector.model is None:
+            return 503, {"error": "model not loaded"}
+
+        start = time.perf_counter()
+        self.metrics.requests += 1
+        try:
+            content_type = headers.get("content-type", "")
+            if content_type.startswith("multipart/form-data"):
+                body = multipart_file(content_type, body)
+            if not body:
+                raise ValueError("empty request body; send the image bytes")
+            result = await self.predict(body)
+        except ValueError as e:
+            self.metrics.errors += 1
+            return 400, {"error": str(e)}
+        except Exception as e:
+            self.metrics.errors += 1
+            return 500, {"error": str(e)}
+        self.metrics.latencies.append(time.perf_counter() - start)
+        return 200, result
+
+    async def respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload).encode()
+        head = (
+            f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode() + body)
+        await writer.drain()
+
+    async def serve(self, host, port):
+        self.pending = asyncio.Queue()
+        batcher = asyncio.create_task(self.batcher())
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"Serving on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            self.pool.shutdown(cancel_futures=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve banknote predictions over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("-m", "--model", default=MODEL_PATH, help="path to the trained model")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="feature extraction processes (default: number of cores)")
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    server = InferenceServer(CurrencyDetector(args.model), args.workers,
+                             args.max_batch, args.max_wait_ms)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Streaming authentication for camera or video input.
+
+Frames are read on a producer thread into a small bounded queue; when
+the scorer falls behind the oldest frame is dropped so verdicts always
+refer to what is under the camera now. Usage:
+
+    python -m stream 0              # first camera
+    python -m stream notes.avi      # video file
+"""
+import argparse
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from logic import CurrencyDetector
+
+MODEL_PATH = "model.joblib"
+# Side of the thumbnail used by the frame-difference gate
+GATE_SIZE = 32
+_END = object()
+
+
+class StreamVerdict:
+    """Smoothed verdict for the note currently in view"""
+    __slots__ = ("note_id", "frame_index", "label", "confidence", "probabilities", "rescored")
+
+    def __init__(self, note_id, frame_index, label, confidence, probabilities, rescored):
+        self.note_id = note_id
+        self.frame_index = frame_index
+        self.label = label
+        self.confidence = confidence
+        self.probabilities = probabilities
+        self.rescored = rescored
+
+    def __repr__(self):
+        return (f"StreamVerdict(note={self.note_id}, frame={self.frame_index}, "
+                f"label={self.label!r}, confidence={self.confidence:.1f})")
+
+
+def open_source(source):
+    """
+    Turn a camera index, video path, cv2.VideoCapture or iterable
+    of BGR frames into a frame iterator.
+    """
+    if isinstance(source, (int, str)):
+        source = cv2.VideoCapture(source)
+    if isinstance(source, cv2.VideoCapture):
+        return _capture_frames(source)
+    return iter(source)
+
+
+def _capture_frames(capture):
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            yield frame
+    finally:
+        capture.release()
+
+
+class StreamAuthenticator:
+    """
+    Bounded producer-consumer pipeline around CurrencyDetector.
+
+    diff_threshold is the mean absolute thumbnail difference (0-255)
+    below which a frame counts as unchanged and is not re-scored;
+    new_note_threshold is the difference that starts a new note and
+    resets smoothing. smoothing is the weight of the newest frame in
+    the exponential moving average of the class probabilities.
+    """
+
+    def __init__(self, detector, queue_size=2, diff_threshold=2.0,
+                 new_note_threshold=25.0, smoothing=0.3):
+        self.detector = detector
+        self.queue_size = queue_size
+        self.diff_threshold = diff_threshold
+        self.new_note_threshold = new_note_threshold
+        self.smoothing = smoothing
+        self.frames_read = 0
+        self.frames_dropped = 0
+        self.frames_skipped = 0
+        self.frames_scored = 0
+        self.elapsed = 0.0
+
+    def _produce(self, frames, buffer, stop):
+        """Read frames into buffer, dropping the oldest one when it is full"""
+        try:
+            for index, frame in enumerate(frames):
+                if stop.is_set():
+                    break
+                self.frames_read += 1
+                while True:
+                    try:
+                        buffer.put_nowait((index, frame))
+                        break
+                    except queue.Full:
+                        try:
+                            buffer.get_nowait()
+                            self.frames_dropped += 1
+                        except queue.Empty:
+                            pass
+        finally:
+            close = getattr(frames, "close", None)
+            if close is not None:
+                # Releases the capture even when the consumer stopped early
+                close()
+            while not stop.is_set():
+                try:
+                    buffer.put(_END, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+    def _score(self, frame):
+        """Run the detector pipeline on one BGR frame"""
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) if frame.ndim == 3 else frame
+        features = self.detector.extract_sobel_features(rgb)
+        return self.detector.predict_features(features)[2][0]
+
+    def run(self, source):
+        """Yield a StreamVerdict for every scored or gated frame of source"""
+        buffer = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        producer = threading.Thread(
+            target=self._produce, args=(open_source(source), buffer, stop), daemon=True
+        )
+        producer.start()
+
+        classes = self.detector.model.classes_
+        note_id = 0
+        last_thumb = None
+        smoothed = None
+        start = time.perf_counter()
+        try:
+            while True:
+                item = buffer.get()
+                if item is _END:
+                    break
+                index, frame = item
+
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+                thumb = cv2.resize(gray, (GATE_SIZE, GATE_SIZE), interpolation=cv2.INTER_AREA)
+                thumb = thumb.astype(np.float32)
+                diff = np.inf if last_thumb is None else float(np.mean(np.abs(thumb - last_thumb)))
+
+                if diff < self.diff_threshold and smoothed is not None:
+                    self.frames_skipped += 1
+                    rescored = False
+                else:
+                    if diff > self.new_note_threshold and last_thumb is not None:
+                        note_id += 1
+                        smoothed = None
+                    last_thumb = thumb
+                    probabilities = self._score(frame)
+                    self.frames_scored += 1
+                    if smoothed is None:
+                        smoothed = probabilities
+                    else:
+                        smoothed = self.smoothing * probabilities + (1 - self.smoothing) * smoothed
+                    rescored = True
+
+                best = int(np.argmax(smoothed))
+                label = "FAKE banknote" if classes[best] == 1 else "REAL banknote"
+                yield StreamVerdict(note_id, index, label, smoothed[best] * 100, smoothed, rescored)
+        finally:
+            stop.set()
+            # Unblock the producer if the caller stopped early, then wait for it
+            while True:
+                try:
+                    buffer.get_nowait()
+                except queue.Empty:
+                    break
+            producer.join()
+            self.elapsed = time.perf_counter() - start
+
+    def stats(self):
+        """Frame counters and processed frames per second"""
+        processed = self.frames_scored + self.frames_skipped
+        return {
+            "frames_read": self.frames_read,
+            "frames_dropped": self.frames_dropped,
+            "frames_skipped": self.frames_skipped,
+            "frames_scored": self.frames_scored,
+            "fps": processed / self.elapsed if self.elapsed else 0.0,
+        }
+
+
+def write_synthetic_video(path, images, frames_per_note=30, size=(640, 360), fps=30):
+    """
+    Write a local test video that shows each image for frames_per_note
+    frames with small sensor noise, for exercising the stream pipeline.
+    """
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, size)
+    rng = np.random.default_rng(0)
+    try:
+        for image in images:
+            frame = cv2.resize(cv2.imread(image), size)
+            for _ in range(frames_per_note):
+                noise = rng.integers(-2, 3, frame.shape, dtype=np.int16)
+                writer.write(np.clip(frame + noise, 0, 255).astype(np.uint8))
+    finally:
+        writer.release()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Authenticate banknotes from a camera or video")
+    parser.add_argument("source", help="camera index or video file")
+    parser.add_argument("-m", "--model", default=MODEL_PATH, help="path to the trained model")
+    parser.add_argument("--diff-threshold", type=float, default=2.0)
+    parser.add_argument("--new-note-threshold", type=float, default=25.0)
+    args = parser.parse_args(argv)
+
+    source = int(args.source) if args.source.isdigit() else args.source
+    authenticator = StreamAuthenticator(
+        CurrencyDetector(args.model),
+        diff_threshold=args.diff_threshold,
+        new_note_threshold=args.new_note_threshold,
+    )
+    last = None
+    for verdict in authenticator.run(source):
+        if last is None or verdict.note_id != last.note_id or verdict.label != last.label:
+            print(verdict)
+        last = verdict
+    print(authenticator.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from logic import (CurrencyDetector, decode_buffer, decode_image, decode_reduced_grayscale,
+                   encoded_buffer)
+
+
+def _jpeg():
+    with open(os.path.join(ROOT, "sampels", "fake money.jpg"), "rb") as f:
+        return f.read()
+
+
+def test_buffer_inputs_decode_like_bytes():
+    data = _jpeg()
+    detector = CurrencyDetector(os.path.join(ROOT, "model.joblib"))
+    expected = detector.extract_features(data)
+    for image in (memoryview(data), np.frombuffer(data, np.uint8),
+                  decode_buffer(encoded_buffer(data))):
+        np.testing.assert_array_equal(detector.extract_features(image), expected)
+
+
+def test_one_dimensional_arrays_are_not_images():
+    assert encoded_buffer(np.frombuffer(_jpeg(), np.uint8)) is not None
+    with pytest.raises(ValueError):
+        decode_image(np.zeros(16, dtype=np.float32))
+    with pytest.raises(ValueError):
+        decode_image(np.array(3))
+
+
+def test_reduced_decode_keeps_the_scale_of_grayscale_jpegs(tmp_path):
+    path = str(tmp_path / "gray.jpg")
+    gray = cv2.imread(os.path.join(ROOT, "sampels", "fake money.jpg"), cv2.IMREAD_GRAYSCALE)
+    cv2.imwrite(path, cv2.resize(gray, (1200, 1000)))
+    reduced = decode_reduced_grayscale(path)
+    assert reduced.dtype == np.uint8 and reduced.shape == (500, 600)
+    assert decode_image(path).dtype == np.uint8
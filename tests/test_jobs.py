@@ -0,0 +1,86 @@
+import csv
+import os
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+import jobs
+from logic import CurrencyDetector
+
+
+def _leases(tmp_path, seconds=60):
+    path = str(tmp_path / "000000.lease")
+    return jobs.Lease(path, "a", seconds), jobs.Lease(path, "b", seconds)
+
+
+def test_lease_is_exclusive_until_it_expires(tmp_path):
+    a, b = _leases(tmp_path, seconds=0.05)
+    assert a.acquire()
+    assert not b.acquire()
+    time.sleep(0.1)
+    assert b.acquire()
+    assert not a.renew()
+    a.release()
+    assert jobs._read_json(b.path)["owner"] == "b"
+    assert b.renew()
+
+
+def test_fresh_lease_is_not_taken_over(tmp_path, monkeypatch):
+    a, b = _leases(tmp_path)
+    assert a.acquire()
+    # b saw an expired lease, but a fresh one is in place by the time it renames
+    monkeypatch.setattr(b, "expired", lambda: True)
+    assert not b.acquire()
+    assert jobs._read_json(a.path)["owner"] == "a"
+    assert a.renew()
+    assert sorted(os.listdir(tmp_path)) == ["000000.lease"]
+
+
+class Crash(BaseException):
+    """Stands in for a worker killed mid-shard"""
+
+
+class CrashingDetector:
+    """Detector that dies on its third batch"""
+
+    def __init__(self, detector):
+        self.detector = detector
+        self.calls = 0
+
+    def extract_many(self, paths):
+        self.calls += 1
+        if self.calls == 3:
+            raise Crash()
+        return self.detector.extract_many(paths)
+
+    def __getattr__(self, name):
+        return getattr(self.detector, name)
+
+
+def test_shard_resumes_from_checkpoint_after_a_crash(tmp_path):
+    job = str(tmp_path / "job")
+    assert jobs.plan(os.path.join(ROOT, "sampels"), job, shard_size=4) == 1
+    paths = jobs._shard_paths(job, 0)
+    detector = CurrencyDetector(os.path.join(ROOT, "model.joblib"))
+
+    first = jobs.Lease(paths["lease"], "w1")
+    assert first.acquire()
+    with pytest.raises(Crash):
+        jobs.process_shard(CrashingDetector(detector), paths, first, chunk_size=1)
+    assert jobs._read_json(paths["checkpoint"])["lines"] == 2
+    # Rows written after the last checkpoint must not survive the restart
+    with open(paths["partial"].format(owner="w1"), "a") as f:
+        f.write("uncommitted,row\n")
+    os.remove(paths["lease"])
+
+    second = jobs.Lease(paths["lease"], "w2")
+    assert second.acquire()
+    assert jobs.process_shard(detector, paths, second, chunk_size=1) == 2
+    with open(paths["output"], newline="") as f:
+        rows = list(csv.DictReader(f))
+    with open(paths["input"]) as f:
+        assert [row["path"] for row in rows] == f.read().splitlines()
+    assert not any(name.startswith("000000.partial") or name.endswith(".ckpt.json")
+                   for name in os.listdir(os.path.join(job, "out")))
@@ -0,0 +1,37 @@
+import glob
+import os
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from logic import CurrencyDetector
+from stream import StreamAuthenticator, write_synthetic_video
+
+
+def _video(tmp_path, frames_per_note=10):
+    path = str(tmp_path / "notes.avi")
+    images = sorted(glob.glob(os.path.join(ROOT, "sampels", "*.jpg")))[:2]
+    write_synthetic_video(path, images, frames_per_note=frames_per_note)
+    return path
+
+
+def _producers():
+    return [t for t in threading.enumerate() if getattr(t, "_target", None) is not None
+            and getattr(t._target, "__name__", "") == "_produce"]
+
+
+def test_run_scores_synthetic_video(tmp_path):
+    authenticator = StreamAuthenticator(CurrencyDetector(os.path.join(ROOT, "model.joblib")))
+    verdicts = list(authenticator.run(_video(tmp_path)))
+    assert verdicts
+    assert authenticator.frames_read == 20
+    assert not _producers()
+
+
+def test_closing_run_early_stops_the_producer(tmp_path):
+    authenticator = StreamAuthenticator(CurrencyDetector(os.path.join(ROOT, "model.joblib")))
+    run = authenticator.run(_video(tmp_path, frames_per_note=60))
+    next(run)
+    next(run)
+    run.close()
+    assert not _producers()
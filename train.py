@@ -0,0 +1,317 @@
+"""
+Scripted training pipeline (replaces the steps in modeling.ipynb).
+
+    python -m train --data data_banknote_authentication.txt
+    python -m train --store features.store
+    python -m train --real scans/real --fake scans/fake --cache features.sqlite
+    python -m train --real scans/real --fake scans/fake --revalidate model.joblib --extractor sobel-int
+
+Image folders go through the same feature code as CurrencyDetector,
+extracted in parallel and cached so reruns skip unchanged images. A
+cross-validated search over forest size and depth records accuracy and
+single-note latency for every candidate, and the chosen model is written
+as a versioned artifact with a JSON metadata sidecar.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import logic
+from features import EXTRACTORS, feature_params, get_extractor
+from instrumentation import single_note_latency
+from scan import chunked, find_images
+# Labels follow CurrencyDetector: class 1 is reported as FAKE
+REAL_LABEL = 0
+FAKE_LABEL = 1
+PARAM_GRID = {
+    "n_estimators": [10, 25, 50, 100, 200],
+    "max_depth": [None, 4, 8, 16],
+}
+
+
+def params_extractor(params):
+    """Extractor described by feature_params"""
+    return get_extractor(params["extractor"], fast=params["fast_features"],
+                         **params.get("extractor_options", {}))
+
+
+def _extract_chunk(paths, params):
+    """Preprocess a chunk of images and run the extractor's batched call once"""
+    extractor = params_extractor(params)
+    stack = [logic.preprocess(path, extractor, params["reduced_decode"]) for path in paths]
+    if not extractor.native_resolution:
+        stack = np.stack(stack)
+    return extractor.extract_batch(stack)
+
+
+def extract_folder_features(paths, params, cache=None, workers=None, chunksize=8):
+    """
+    Feature matrix for paths, computed on a process pool. Images whose
+    content and preprocessing parameters are already in cache are not
+    decoded again.
+    """
+    from feature_cache import cache_key
+    n_features = params_extractor(params).n_features
+    features = np.empty((len(paths), n_features))
+    keys = [None] * len(paths)
+    todo = []
+    for i, path in enumerate(paths):
+        if cache is not None:
+            with open(path, "rb") as f:
+                keys[i] = cache_key(f.read(), sorted(params.items()))
+            hit = cache.get(keys[i])
+            if hit is not None:
+                features[i] = hit[0]
+                continue
+        todo.append(i)
+
+    if todo:
+        chunks = list(chunked(todo, chunksize))
+        with ProcessPoolExecutor(workers or os.cpu_count() or 1) as pool:
+            results = pool.map(_extract_chunk, [[paths[i] for i in c] for c in chunks],
+                               [params] * len(chunks))
+            for chunk, rows in zip(chunks, results):
+                for i, row in zip(chunk, rows):
+                    features[i] = row
+                    if cache is not None:
+                        cache.put(keys[i], row)
+    print(f"Extracted {len(todo)} images ({len(paths) - len(todo)} from cache)")
+    return features
+
+
+def load_dataset(args, params):
+    """Return (X, y, description) from the UCI text file, a feature store or image folders"""
+    if args.data:
+        data = np.loadtxt(args.data, delimiter=",")
+        return data[:, :-1], data[:, -1].astype(int), {"source": os.path.basename(args.data)}
+    if args.store:
+        from feature_store import FeatureStore
+        store = FeatureStore(args.store)
+        stored = store.meta.get("feature_params")
+        if stored is not None and not store.same_params(params):
+            raise ValueError(f"{args.store} holds features extracted with {stored}, not {params}; "
+                             f"pass the matching --extractor, --fast-features and --reduced-decode")
+        X, y = store.training_set()
+        return np.asarray(X, dtype=np.float64), y, {"source": os.path.basename(os.path.normpath(args.store))}
+
+    cache = None
+    if args.cache:
+        from feature_cache import FeatureCache
+        cache = FeatureCache(args.cache, max_bytes=1024 * 1024 * 1024)
+    real = sorted(find_images(args.real))
+    fake = sorted(find_images(args.fake))
+    X = extract_folder_features(real + fake, params, cache, args.workers)
+    y = np.array([REAL_LABEL] * len(real) + [FAKE_LABEL] * len(fake))
+    if cache is not None:
+        print(f"Feature cache: {cache.stats()}")
+        cache.close()
+    return X, y, {"source": "images", "real": len(real), "fake": len(fake)}
+
+
+def search(X_train, y_train, workers=None, folds=5, seed=42):
+    """
+    Parallel cross-validated grid search. Returns one row per candidate
+    with its mean accuracy and single-note latency.
+    """
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.model_selection import GridSearchCV, StratifiedKFold
+
+    grid = GridSearchCV(
+        RandomForestClassifier(random_state=seed),
+        PARAM_GRID,
+        cv=StratifiedKFold(folds, shuffle=True, random_state=seed),
+        scoring="accuracy",
+        n_jobs=workers or -1,
+        refit=False,
+    )
+    grid.fit(X_train, y_train)
+
+    candidates = []
+    for i, params in enumerate(grid.cv_results_["params"]):
+        model = RandomForestClassifier(random_state=seed, **params).fit(X_train, y_train)
+        candidates.append({
+            "params": params,
+            "cv_accuracy": float(grid.cv_results_["mean_test_score"][i]),
+            "cv_accuracy_std": float(grid.cv_results_["std_test_score"][i]),
+            "latency_ms": single_note_latency(model, X_train) * 1000,
+        })
+    return candidates
+
+
+def choose(candidates, latency_budget_ms=None, tolerance=0.002):
+    """
+    Most accurate candidate within the latency budget; candidates within
+    tolerance of the best accuracy are treated as tied and the fastest wins.
+    """
+    pool = [c for c in candidates if latency_budget_ms is None or c["latency_ms"] <= latency_budget_ms]
+    if not pool:
+        raise ValueError(f"no candidate meets the {latency_budget_ms} ms latency budget")
+    best = max(c["cv_accuracy"] for c in pool)
+    tied = [c for c in pool if c["cv_accuracy"] >= best - tolerance]
+    return min(tied, key=lambda c: c["latency_ms"])
+
+
+def dataset_hash(X, y):
+    h = hashlib.sha256(np.ascontiguousarray(X, dtype=np.float64).tobytes())
+    h.update(np.ascontiguousarray(y, dtype=np.int64).tobytes())
+    return h.hexdigest()[:16]
+
+
+def save_artifact(model, metadata, output_dir):
+    """Write <name>.joblib plus a <name>.json metadata sidecar; returns the model path"""
+    import joblib
+    os.makedirs(output_dir, exist_ok=True)
+    name = f"banknote-{metadata['version']}"
+    model_path = os.path.join(output_dir, name + ".joblib")
+    joblib.dump(model, model_path)
+    with open(model_path, "rb") as f:
+        metadata["model_sha256"] = hashlib.sha256(f.read()).hexdigest()
+    with open(os.path.join(output_dir, name + ".json"), "w") as f:
+        json.dump(metadata, f, indent=2)
+    return model_path
+
+
+def extractor_options(args):
+    """Extractor constructor options given on the command line"""
+    if args.extractor == "tiles":
+        options = {"grid": args.tile_grid, "overlap": args.tile_overlap}
+        if args.rois:
+            with open(args.rois) as f:
+                options["rois"] = json.load(f)
+        return options
+    if args.extractor == "sobel-int":
+        return {"magnitude": args.magnitude}
+    return {}
+
+
+def revalidate(args):
+    """
+    Check a trained model against features from another extraction
+    path (e.g. --extractor sobel-int) on labelled image folders before
+    switching to it: per-feature drift, prediction agreement and
+    accuracy. Returns 1 if accuracy drops by more than --tolerance.
+    """
+    model, _, metadata = logic.load_model(args.revalidate)
+    baseline = dict(feature_params(), **metadata.get("features", {}))
+    candidate = feature_params(args.extractor, args.fast_features, args.reduced_decode,
+                               extractor_options(args))
+    X_base, y, _ = load_dataset(args, baseline)
+    X_new = load_dataset(args, candidate)[0]
+    if X_new.shape != X_base.shape:
+        print(f"{candidate['extractor']} gives {X_new.shape[1]} features, the model expects "
+              f"{X_base.shape[1]}: train a new model with --extractor {candidate['extractor']}")
+        return 1
+
+    drift = np.abs(X_new - X_base) / np.maximum(np.abs(X_base), 1e-12)
+    for name, worst, median in zip(params_extractor(candidate).feature_names,
+                                   drift.max(axis=0), np.median(drift, axis=0)):
+        print(f"{name:<12} relative drift: median {median:.2%}, max {worst:.2%}")
+    pred_base = model.predict(X_base)
+    pred_new = model.predict(X_new)
+    acc_base = float(np.mean(pred_base == y))
+    acc_new = float(np.mean(pred_new == y))
+    print(f"Accuracy {acc_base:.4f} ({baseline['extractor']}) -> {acc_new:.4f} "
+          f"({candidate['extractor']}), agreement {np.mean(pred_base == pred_new):.4f}")
+    if acc_base - acc_new > args.tolerance:
+        print(f"Accuracy dropped by more than {args.tolerance}: "
+              f"retrain with --extractor {candidate['extractor']}")
+        return 1
+    print("Model re-validated")
+    return 0
+
+
+def train(args):
+    import sklearn
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.model_selection import train_test_split
+
+    params = feature_params(args.extractor, args.fast_features, args.reduced_decode,
+                            extractor_options(args))
+    X, y, source = load_dataset(args, params)
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=args.seed, stratify=y
+    )
+
+    start = time.perf_counter()
+    candidates = search(X_train, y_train, args.workers, args.folds, args.seed)
+    chosen = choose(candidates, args.latency_budget_ms)
+    for c in sorted(candidates, key=lambda c: -c["cv_accuracy"]):
+        marker = "*" if c is chosen else " "
+        print(f"{marker} {str(c['params']):<45} acc {c['cv_accuracy']:.4f} "
+              f"± {c['cv_accuracy_std']:.4f}  {c['latency_ms']:.2f} ms")
+
+    model = RandomForestClassifier(random_state=args.seed, **chosen["params"])
+    model.fit(X_train, y_train)
+    test_accuracy = float(model.score(X_test, y_test))
+    print(f"Search took {time.perf_counter() - start:.1f}s; held-out accuracy {test_accuracy:.4f}")
+
+    digest = dataset_hash(X, y)
+    metadata = {
+        "version": time.strftime("%Y%m%d-%H%M%S") + "-" + digest[:8],
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "model": "RandomForestClassifier",
+        "params": chosen["params"],
+        "cv_accuracy": chosen["cv_accuracy"],
+        "test_accuracy": test_accuracy,
+        "latency_ms": chosen["latency_ms"],
+        "features": params,
+        "feature_names": params_extractor(params).feature_names,
+        "classes": model.classes_.tolist(),
+        "dataset": dict(source, sha256=digest, samples=int(len(y))),
+        "sklearn_version": sklearn.__version__,
+        "candidates": candidates,
+    }
+    model_path = save_artifact(model, metadata, args.output_dir)
+    print(f"Saved {model_path}")
+    return model_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train a banknote model")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--data", help="CSV of precomputed features with the label in the last column")
+    source.add_argument("--store", help="feature store directory; its ground-truth rows are used")
+    source.add_argument("--real", help="folder of genuine banknote images")
+    parser.add_argument("--fake", help="folder of counterfeit banknote images")
+    parser.add_argument("--cache", default=None, help="SQLite feature cache for image folders")
+    parser.add_argument("--extractor", choices=sorted(EXTRACTORS), default="sobel",
+                        help="feature extractor for image folders (recorded in the metadata)")
+    parser.add_argument("--tile-grid", type=int, nargs=2, default=[3, 3], metavar=("ROWS", "COLS"),
+                        help="tile grid of the tiles extractor")
+    parser.add_argument("--tile-overlap", type=float, default=0.25,
+                        help="fraction by which tiles extend into their neighbours")
+    parser.add_argument("--rois", default=None,
+                        help="JSON list of [x0, y0, x1, y1] image fractions used instead of tiles")
+    parser.add_argument("--magnitude", choices=["l1", "alpha-max-beta-min"],
+                        default="alpha-max-beta-min", help="gradient magnitude of sobel-int")
+    parser.add_argument("--fast-features", action="store_true")
+    parser.add_argument("--reduced-decode", action="store_true")
+    parser.add_argument("--latency-budget-ms", type=float, default=None,
+                        help="only consider models whose single-note latency fits this budget")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("-j", "--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("-o", "--output-dir", default="models")
+    parser.add_argument("--revalidate", metavar="MODEL", default=None,
+                        help="instead of training, check MODEL against the features of "
+                             "--extractor on the image folders")
+    parser.add_argument("--tolerance", type=float, default=0.01,
+                        help="accuracy drop allowed by --revalidate (default: 0.01)")
+    args = parser.parse_args(argv)
+    if args.real and not args.fake:
+        parser.error("--real requires --fake")
+    if args.revalidate:
+        if not args.real:
+            parser.error("--revalidate needs --real and --fake image folders")
+        return revalidate(args)
+    train(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())